@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+import io
+import os
+import queue
+import zipfile
+import logging
+import threading
+
+# ─── Configuration ─────────────────────────────────────────────────────────────
+STREAM_CHUNK       = 64 * 1024
+PARTIAL_SUFFIXES   = (".part", ".part.json")
+COMPRESSION        = "deflate"
+
+# Per-extension (compress_type, level) policies; "*" covers everything else.
+# EDF waveforms are already dense, so they get little from deflate while
+# costing most of the CPU on a Pi Zero. Pick one with bench_zip.py.
+COMPRESSION_POLICIES = {
+    "deflate":    {"*": (zipfile.ZIP_DEFLATED, 6)},
+    "fast":       {"*": (zipfile.ZIP_DEFLATED, 1)},
+    "edf-fast":   {".edf": (zipfile.ZIP_DEFLATED, 1), "*": (zipfile.ZIP_DEFLATED, 6)},
+    "edf-stored": {".edf": (zipfile.ZIP_STORED, None), "*": (zipfile.ZIP_DEFLATED, 6)},
+    "stored":     {"*": (zipfile.ZIP_STORED, None)},
+}
+
+logger = logging.getLogger("uploader")
+
+def log(msg):
+    logger.info(msg)
+
+def archive_name(rel_path):
+    # Split off extension and lowercase it
+    base, ext = os.path.splitext(rel_path)
+    return base.replace(os.sep, "/") + ext.lower()
+
+def member_compression(rel_path, policy=COMPRESSION):
+    """
+    (compress_type, level) for rel_path under the named policy.
+    """
+    rules = COMPRESSION_POLICIES[policy]
+    return rules.get(os.path.splitext(rel_path)[1].lower(), rules["*"])
+
+def _add_file(zf, full, rel_path, policy):
+    arc = archive_name(rel_path)
+    compress_type, level = member_compression(rel_path, policy)
+    log(f"    🗜 Adding {rel_path} as {arc}")
+    zf.write(full, arc, compress_type=compress_type, compresslevel=level)
+
+def zip_members(root, start_date=None):
+    """
+    Relative paths of every file under root that belongs in an archive,
+    skipping DATALOG nights before start_date and leftovers from
+    interrupted transfers.
+    """
+    members = []
+    for dirpath, _, files in os.walk(root):
+        rel_root = os.path.relpath(dirpath, root).split(os.sep)
+        if start_date and rel_root[0] == "DATALOG" and len(rel_root) > 1 and rel_root[1] < start_date:
+            continue
+        for fname in sorted(files):
+            if fname.endswith(PARTIAL_SUFFIXES):
+                continue
+            members.append(os.path.relpath(os.path.join(dirpath, fname), root))
+    return members
+
+def write_zip(zip_name, root, rel_paths, policy=COMPRESSION):
+    with zipfile.ZipFile(zip_name, "w", zipfile.ZIP_DEFLATED) as zf:
+        for rel_path in rel_paths:
+            _add_file(zf, os.path.join(root, rel_path), rel_path, policy)
+
+class ZipPipeline:
+    """
+    Compresses files into an archive on a background thread, so each file
+    can be added as soon as it lands on disk while the next one is still
+    downloading. Only the pipeline thread touches the ZipFile.
+    """
+
+    def __init__(self, zip_name, root, policy=COMPRESSION):
+        self.zip_name = zip_name
+        self.root = root
+        self.policy = policy
+        self.error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="zip", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            with zipfile.ZipFile(self.zip_name, "w", zipfile.ZIP_DEFLATED) as zf:
+                while (rel_path := self._queue.get()) is not None:
+                    _add_file(zf, os.path.join(self.root, rel_path), rel_path, self.policy)
+        except Exception as e:
+            self.error = e
+            # Keep draining so producers never block on a dead pipeline
+            while self._queue.get() is not None:
+                pass
+
+    def add(self, rel_path):
+        self._queue.put(rel_path)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self.error:
+            raise self.error
+        log("✅ ZIP created")
+
+class _StreamSink(io.RawIOBase):
+    """
+    Write-only, non-seekable target for ZipFile. It supports tell() but not
+    seek(), so zipfile writes data descriptors rather than rewinding.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.buffer += b
+        self.position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+def iter_zip(root, rel_paths, chunk_size=STREAM_CHUNK, policy=COMPRESSION):
+    """
+    Yield a ZIP archive of rel_paths (relative to root) chunk by chunk,
+    compressing as it goes, without writing the archive anywhere.
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        for rel_path in rel_paths:
+            full = os.path.join(root, rel_path)
+            info = zipfile.ZipInfo.from_file(full, archive_name(rel_path))
+            info.compress_type, level = member_compression(rel_path, policy)
+            # Python 3.13 renamed ZipInfo._compresslevel to compress_level
+            if hasattr(info, "compress_level"):
+                info.compress_level = level
+            else:
+                info._compresslevel = level
+            log(f"    🗜 Streaming {rel_path} as {info.filename}")
+            with open(full, "rb") as src, zf.open(info, "w") as dst:
+                while block := src.read(chunk_size):
+                    dst.write(block)
+                    if len(sink.buffer) >= chunk_size:
+                        yield sink.drain()
+            if sink.buffer:
+                yield sink.drain()
+    if sink.buffer:
+        yield sink.drain()
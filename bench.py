@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark: runs sleep.main() against the local simulators in
+simulator.py and reports wall time, peak RSS and call counts per phase,
+plus requests and bytes per endpoint.
+
+    python3 bench.py --nights 14 --latency 0.05 --bandwidth-kbps 800
+
+Run 1 starts from an empty work dir; each further run adds one night to
+the simulated card first, like the next morning's sync.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+from datetime import timedelta
+
+import simulator
+
+# ─── Configuration ─────────────────────────────────────────────────────────────
+RSS_INTERVAL       = 0.02
+PHASES             = [
+    # (phase, module attribute or "Class.method")
+    ("auth",        "get_token_from_config"),
+    ("auth",        "fetch_team_id"),
+    ("wifi",        "switch_wifi"),
+    ("listing",     "EzShareClient.get_listing"),
+    ("fingerprint", "remote_hash_folder"),
+    ("download",    "download_file"),
+    ("upload",      "create_import"),
+    ("upload",      "upload_delta"),
+    ("upload",      "upload_zip_stream"),
+    ("upload",      "upload_zip"),
+    ("upload",      "zip_folder"),
+    ("upload",      "process_import"),
+]
+
+def current_rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class PhaseRecorder:
+    """
+    Wraps functions so every call is attributed to a phase. Overlapping
+    calls (worker threads) count once toward the phase's wall time; a
+    sampler thread charges RSS to whichever phases are active.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = {}
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def _phase(self, name):
+        return self.phases.setdefault(name, {"calls": 0, "active": 0, "wall": 0.0,
+                                             "since": None, "peak_rss_kb": 0})
+
+    def _sample(self):
+        while not self._stop.wait(RSS_INTERVAL):
+            rss = current_rss_kb()
+            with self._lock:
+                for p in self.phases.values():
+                    if p["active"]:
+                        p["peak_rss_kb"] = max(p["peak_rss_kb"], rss)
+
+    def enter(self, name):
+        with self._lock:
+            p = self._phase(name)
+            p["calls"] += 1
+            if p["active"] == 0:
+                p["since"] = time.perf_counter()
+            p["active"] += 1
+            p["peak_rss_kb"] = max(p["peak_rss_kb"], current_rss_kb())
+
+    def exit(self, name):
+        with self._lock:
+            p = self.phases[name]
+            p["active"] -= 1
+            if p["active"] == 0:
+                p["wall"] += time.perf_counter() - p["since"]
+
+    def wrap(self, owner, attr, phase):
+        original = getattr(owner, attr)
+
+        def wrapper(*args, **kwargs):
+            self.enter(phase)
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.exit(phase)
+
+        setattr(owner, attr, wrapper)
+
+    def reset(self):
+        with self._lock:
+            self.phases = {}
+
+    def close(self):
+        self._stop.set()
+
+def instrument(sleep, recorder):
+    for phase, target in PHASES:
+        owner, _, attr = target.rpartition(".")
+        obj = getattr(sleep, owner) if owner else sleep
+        if hasattr(obj, attr):
+            recorder.wrap(obj, attr, phase)
+
+def report(title, wall, recorder, stats):
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"\n── {title}: {wall:.2f} s wall, process peak RSS {peak / 1024:.1f} MB")
+    print(f"  {'phase':<12} {'wall s':>8} {'calls':>6} {'peak RSS MB':>12}")
+    for name, p in sorted(recorder.phases.items(), key=lambda kv: -kv[1]["wall"]):
+        print(f"  {name:<12} {p['wall']:>8.2f} {p['calls']:>6} {p['peak_rss_kb'] / 1024:>12.1f}")
+    print(f"  {'endpoint':<14} {'requests':>8} {'KB out':>10} {'KB in':>10}")
+    for kind, s in stats.snapshot().items():
+        print(f"  {kind:<14} {s['requests']:>8} {s['bytes_out'] / 1024:>10.0f} {s['bytes_in'] / 1024:>10.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sleep.py against the simulators")
+    parser.add_argument("--nights", type=int, default=7)
+    parser.add_argument("--runs", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth-kbps", type=float, default=0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--ezshare-port", type=int, default=simulator.EZSHARE_PORT)
+    parser.add_argument("--sleephq-port", type=int, default=simulator.SLEEPHQ_PORT)
+    parser.add_argument("--workdir", help="keep state here instead of a temp dir")
+    parser.add_argument("--verbose", action="store_true", help="show uploader log lines")
+    args = parser.parse_args()
+
+    card, stats, ez, hq = simulator.start(args.nights, args.latency, args.bandwidth_kbps,
+                                          args.drop_rate, args.ezshare_port, args.sleephq_port)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="sleephq-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    os.chdir(workdir)
+    with open("config.json", "w") as f:
+        json.dump({"client_id": "sim", "client_secret": "sim",
+                   "username": "sim", "password": "sim"}, f)
+
+    import sleep
+    sleep.EZSHARE_BASE = f"http://127.0.0.1:{args.ezshare_port}"
+    sleep.SLEEPHQ_BASE = f"http://127.0.0.1:{args.sleephq_port}"
+    sleep.switch_wifi = lambda profile: True
+    if not args.verbose:
+        sleep.logger.removeHandler(sleep.ch)
+    recorder = PhaseRecorder()
+    instrument(sleep, recorder)
+
+    print(f"Work dir {workdir}; card has {len(card.files)} files")
+    last_night = max(p.split("/")[1] for p in card.files if p.startswith("DATALOG/"))
+    try:
+        for run in range(1, args.runs + 1):
+            if run > 1:
+                night = card.mtimes[next(p for p in card.files if last_night in p)] + timedelta(days=1)
+                last_night = night.strftime("%Y%m%d")
+                for suffix, size in simulator.NIGHT_FILES.items():
+                    card.add(f"DATALOG/{last_night}/{last_night}_223000_{suffix}", size, night)
+            stats.reset()
+            recorder.reset()
+            start = time.perf_counter()
+            sleep.main()
+            report(f"Run {run}" + (" (cold)" if run == 1 else f" (+1 night {last_night})"),
+                   time.perf_counter() - start, recorder, stats)
+    finally:
+        recorder.close()
+        ez.shutdown()
+        hq.shutdown()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
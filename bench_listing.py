@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import sys
+import time
+import subprocess
+import tracemalloc
+import importlib.util
+import ezshare
+import simulator
+
+# ─── Configuration ─────────────────────────────────────────────────────────────
+NIGHTS             = 400     # synthetic DATALOG page with this many folders
+ROUNDS             = 50
+
+def import_cost(module):
+    """
+    Wall time to start a fresh interpreter and import module, in ms.
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+    return (time.perf_counter() - start) * 1000
+
+def bench(parse, page):
+    tracemalloc.start()
+    entries = parse(page)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        parse(page)
+    return (time.perf_counter() - start) * 1000 / ROUNDS, peak, len(entries)
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print("Usage: python3 bench_listing.py [captured_page.html ...]")
+        sys.exit(0)
+    if len(sys.argv) > 1:
+        pages = {path: open(path, encoding="utf-8", errors="replace").read() for path in sys.argv[1:]}
+    else:
+        card = simulator.CardImage(NIGHTS)
+        pages = {f"synthetic DATALOG ({NIGHTS} folders)": card.listing("DATALOG").decode("utf-8"),
+                 "synthetic root": card.listing("").decode("utf-8")}
+
+    parsers = {"regex": lambda page: ezshare.ListingParser().feed(page)}
+    has_bs4 = importlib.util.find_spec("bs4") is not None
+    if has_bs4:
+        parsers["bs4"] = ezshare.parse_listing_bs4
+    else:
+        print("bs4 not installed; only timing the regex parser")
+
+    print(f"{'page':<36} {'parser':<6} {'entries':>7} {'ms/page':>8} {'peak KB':>8}")
+    for title, page in pages.items():
+        results = {}
+        for name, parse in parsers.items():
+            ms, peak, count = bench(parse, page)
+            results[name] = parse(page)
+            print(f"{title[:36]:<36} {name:<6} {count:>7} {ms:>8.2f} {peak / 1024:>8.0f}")
+        if len(results) == 2 and results["regex"] != results["bs4"]:
+            print(f"  ⚠️  parsers disagree on {title}")
+    print()
+    print(f"import cost: re {import_cost('re'):.0f} ms, "
+          f"bs4 {import_cost('bs4') if has_bs4 else float('nan'):.0f} ms (fresh interpreter)")
+
+if __name__ == "__main__":
+    main()
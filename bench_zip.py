@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+from archive import COMPRESSION_POLICIES, iter_zip, zip_members
+
+# ─── Configuration ─────────────────────────────────────────────────────────────
+SAMPLE_DIR         = "downloads"
+UPLINK_KBPS        = 2000     # upstream bandwidth to SleepHQ, kbit/s
+
+def bench_policy(root, members, policy):
+    start = time.perf_counter()
+    size = sum(len(chunk) for chunk in iter_zip(root, members, policy=policy))
+    return time.perf_counter() - start, size
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] in ("-h", "--help"):
+        print("Usage: python3 bench_zip.py [sample_dir] [uplink_kbps]")
+        sys.exit(0)
+    root = args[0] if args else SAMPLE_DIR
+    uplink = float(args[1]) if len(args) > 1 else UPLINK_KBPS
+    members = zip_members(root)
+    if not members:
+        print(f"No files under {root}")
+        sys.exit(1)
+
+    raw = sum(os.path.getsize(os.path.join(root, m)) for m in members)
+    by_ext = {}
+    for m in members:
+        ext = os.path.splitext(m)[1].lower() or "(none)"
+        by_ext[ext] = by_ext.get(ext, 0) + os.path.getsize(os.path.join(root, m))
+    print(f"{len(members)} files, {raw / 1024:.0f} KB from {root}; uplink {uplink:.0f} kbit/s")
+    print("  " + ", ".join(f"{ext}: {n / 1024:.0f} KB" for ext, n in sorted(by_ext.items())))
+    print()
+    print(f"{'policy':<12} {'compress s':>10} {'size KB':>9} {'ratio':>6} {'upload s':>9} {'zip+upload s':>13} {'streamed s':>11}")
+    for policy in COMPRESSION_POLICIES:
+        seconds, size = bench_policy(root, members, policy)
+        upload = size * 8 / (uplink * 1000)
+        print(f"{policy:<12} {seconds:>10.2f} {size / 1024:>9.0f} {size / raw:>6.2f} "
+              f"{upload:>9.1f} {seconds + upload:>13.1f} {max(seconds, upload):>11.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+import os
+import re
+import json
+import html
+import codecs
+import hashlib
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from metrics import metrics
+
+# ─── Configuration ─────────────────────────────────────────────────────────────
+EZSHARE_BASE       = "http://192.168.4.1"
+WHITELIST          = [".edf", ".crc", ".json", ".tgt", ".log"]
+CONNECT_TIMEOUT    = 5
+READ_TIMEOUT       = 10
+POOL_SIZE          = 4
+CHUNK_SIZE         = 64 * 1024
+
+# "2025- 5-13   22:01:02          9KB  " in front of each link on a /dir page
+LISTING_META = re.compile(
+    r"(\d{4})-\s*(\d{1,2})-\s*(\d{1,2})\s+(\d{1,2}):(\d{2}):(\d{2})\s+(\S+)\s*$"
+)
+# The same columns followed by the link, as one regex over the raw page
+LISTING_ENTRY = re.compile(
+    r"(?:(\d{4})-\s*(\d{1,2})-\s*(\d{1,2})\s+(\d{1,2}):(\d{2}):(\d{2})\s+(\S+)\s*)?"
+    r"<a\b[^>]*?\bhref\s*=\s*[\"']?([^\"' >]*)[\"']?[^>]*>(.*?)</a\s*>",
+    re.IGNORECASE | re.DOTALL,
+)
+TAG          = re.compile(r"<[^>]*>")
+SIZE_UNITS   = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+logger = logging.getLogger("uploader")
+
+def parse_size(token):
+    """
+    Turn an EzShare size column ("9KB", "1.2MB", "5120") into bytes.
+    Returns None for <DIR> or anything else we can't read.
+    """
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMG]?)B?", token.strip(), re.IGNORECASE)
+    if not m:
+        return None
+    return int(float(m.group(1)) * SIZE_UNITS[m.group(2).upper()])
+
+def _entry(name, href, meta):
+    size = timestamp = None
+    is_dir = "dir?" in href
+    if meta[0] is not None:
+        y, mo, d, hh, mm, ss, tok = meta
+        timestamp = f"{int(y):04d}-{int(mo):02d}-{int(d):02d}T{int(hh):02d}:{mm}:{ss}"
+        is_dir = is_dir or tok.upper() == "<DIR>"
+        size = None if is_dir else parse_size(tok)
+    return {
+        "name":      name,
+        "href":      href,
+        "size":      size,
+        "timestamp": timestamp,
+        "is_dir":    is_dir,
+    }
+
+class ListingParser:
+    """
+    Incremental parser for EzShare /dir pages. Feed it text as it arrives;
+    every complete "<meta> <a href=...>name</a>" is turned into an entry
+    and only the unfinished tail is kept buffered.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, text):
+        self._buffer += text
+        entries = []
+        end = 0
+        for m in LISTING_ENTRY.finditer(self._buffer):
+            meta = tuple(html.unescape(g) if g else g for g in m.groups()[:7])
+            name = html.unescape(TAG.sub("", m.group(9))).strip()
+            entries.append(_entry(name, html.unescape(m.group(8)), meta))
+            end = m.end()
+        self._buffer = self._buffer[end:]
+        return entries
+
+def parse_listing_bs4(page):
+    """
+    BeautifulSoup fallback for pages the regex parser doesn't understand.
+    bs4 is imported lazily: it is optional and slow to import on a Pi Zero.
+    """
+    from bs4 import BeautifulSoup, NavigableString
+    soup = BeautifulSoup(page, "html.parser")
+    entries = []
+    for a in soup.find_all("a"):
+        meta = (None,) * 7
+        prev = a.previous_sibling
+        if isinstance(prev, NavigableString) and str(prev).strip():
+            m = LISTING_META.search(str(prev).splitlines()[-1])
+            if m:
+                meta = m.groups()
+        entries.append(_entry(a.text.strip(), a.get("href", ""), meta))
+    return entries
+
+def parse_listing(page):
+    """
+    Parse an EzShare /dir page into entries
+    {"name", "href", "size", "timestamp", "is_dir"}.
+    size is None when the size column is missing or unparseable.
+    """
+    entries = ListingParser().feed(page)
+    if not entries and "<a" in page.lower():
+        try:
+            return parse_listing_bs4(page)
+        except ImportError:
+            logger.info("⚠️  Unrecognised listing page and bs4 is not installed")
+    return entries
+
+def find_entry(entries, name):
+    return next((e for e in entries if e["name"] == name), None)
+
+class EzShareClient:
+    """
+    Talks to the EzShare card over one pooled keep-alive session.
+
+    Every listing, HEAD and download goes through self.session so the card's
+    weak access point only sees a handful of TCP connections per run.
+    Parsed listings are cached by URL for the life of the client (one
+    session on the card); call invalidate() when the card may have changed.
+    """
+
+    def __init__(self, base_url=EZSHARE_BASE, whitelist=WHITELIST,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 pool_size=POOL_SIZE, log=None):
+        self.base_url = base_url.rstrip("/")
+        self.whitelist = [ext.lower() for ext in whitelist]
+        self.timeout = (connect_timeout, read_timeout)
+        self.log = log or logger.info
+        self.chunk_size = CHUNK_SIZE
+        self._listings = {}
+        self._listings_lock = threading.Lock()
+        self.session = metrics.instrument(requests.Session())
+        retry = Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504],
+                      allowed_methods=["GET", "HEAD"])
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def resolve_url(self, href: str) -> str:
+        """
+        Resolve an EzShare listing href to a full URL.
+        """
+        href = href.strip()
+        if href.lower().startswith("http"):
+            return href
+        return f"{self.base_url}/{href.lstrip('/')}"
+
+    def get(self, href, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        r = self.session.get(self.resolve_url(href), **kwargs)
+        r.raise_for_status()
+        return r
+
+    def invalidate(self, href=None):
+        """
+        Forget one cached listing, or all of them when href is None.
+        """
+        with self._listings_lock:
+            if href is None:
+                self._listings.clear()
+            else:
+                self._listings.pop(self.resolve_url(href), None)
+
+    @metrics.span("listing")
+    def get_listing(self, href="dir", refresh=False):
+        """
+        Parsed entries of a listing page, from the cache when this session
+        already fetched it.
+        """
+        url = self.resolve_url(href)
+        with self._listings_lock:
+            cached = None if refresh else self._listings.get(url)
+        if cached is not None:
+            return cached
+        entries = self._fetch_listing(url)
+        with self._listings_lock:
+            self._listings[url] = entries
+        return entries
+
+    def _fetch_listing(self, href):
+        """
+        Fetch and parse a listing page, parsing chunks as they arrive.
+        """
+        parser = ListingParser()
+        entries, page = [], []
+        with self.get(href, stream=True) as r:
+            decoder = codecs.getincrementaldecoder(r.encoding or "utf-8")(errors="replace")
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                text = decoder.decode(chunk)
+                page.append(text)
+                entries += parser.feed(text)
+            entries += parser.feed(decoder.decode(b"", final=True))
+        if not entries:
+            return parse_listing("".join(page))
+        return entries
+
+    @metrics.span("head")
+    def head_size(self, href):
+        head = self.session.head(self.resolve_url(href), timeout=self.timeout)
+        head.raise_for_status()
+        return int(head.headers.get("Content-Length", "0"))
+
+    def is_wanted(self, entry):
+        return ("download?file=" in entry["href"]
+                and any(entry["name"].lower().endswith(ext) for ext in self.whitelist))
+
+    def _resume_offset(self, href, tmp, meta_path):
+        """
+        Bytes already on disk from an earlier, interrupted transfer of href,
+        or 0 when there is nothing usable to continue from.
+        """
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            received = os.path.getsize(tmp)
+        except (OSError, ValueError):
+            return 0
+        if meta.get("href") != href or received > (meta.get("expected") or 0):
+            return 0
+        return received
+
+    def _save_partial(self, meta_path, href, received, expected):
+        with open(meta_path, "w") as f:
+            json.dump({"href": href, "received": received, "expected": expected}, f)
+
+    def _open_stream(self, href, offset):
+        if not offset:
+            return self.get(href, stream=True)
+        try:
+            return self.get(href, stream=True, headers={"Range": f"bytes={offset}-"})
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 416:
+                raise
+            # Card rejects the range (file shrank or was rewritten): start over
+            return self.get(href, stream=True)
+
+    @metrics.span("download")
+    def download(self, href, dest):
+        """
+        Stream href into dest in self.chunk_size pieces. The body goes to
+        dest + ".part" and is renamed into place only once complete, so
+        memory stays flat and a dropped transfer never leaves a truncated
+        file under the real name. The read timeout applies per chunk,
+        not to the whole body.
+
+        An interrupted transfer keeps its .part file plus a .part.json
+        sidecar with the bytes received and the expected size; the next
+        call continues it with a Range request, or refetches from zero if
+        the card ignores Range or the file's size changed.
+
+        The SHA-256 is computed as bytes arrive, so callers never have to
+        read the file back. Returns {"bytes": transferred by this call,
+        "size": final size, "sha256": hex digest}.
+        """
+        tmp = dest + ".part"
+        meta_path = tmp + ".json"
+        offset = self._resume_offset(href, tmp, meta_path)
+        written = 0
+        expected = None
+        sha = hashlib.sha256()
+        try:
+            with self._open_stream(href, offset) as r:
+                total = None
+                if offset and r.status_code == 206:
+                    m = re.search(r"/(\d+)$", r.headers.get("Content-Range", ""))
+                    total = int(m.group(1)) if m else None
+                    with open(meta_path) as f:
+                        previous = json.load(f).get("expected")
+                    if total is None or total != previous:
+                        # Size changed on the card; the prefix is stale
+                        r.close()
+                        os.remove(tmp)
+                        os.remove(meta_path)
+                        return self.download(href, dest)
+                    self.log(f"    ↻ Resuming at {offset} of {total} bytes")
+                    mode = "ab"
+                    with open(tmp, "rb") as f:
+                        while block := f.read(self.chunk_size):
+                            sha.update(block)
+                else:
+                    offset = 0
+                    mode = "wb"
+                    if "Content-Encoding" not in r.headers and "Content-Length" in r.headers:
+                        total = int(r.headers["Content-Length"])
+                expected = total
+                self._save_partial(meta_path, href, offset, expected)
+                with open(tmp, mode) as f:
+                    for chunk in r.iter_content(chunk_size=self.chunk_size):
+                        f.write(chunk)
+                        sha.update(chunk)
+                        written += len(chunk)
+            if expected is not None and offset + written != expected:
+                raise IOError(f"Short read for {href}: {offset + written} of {expected} bytes")
+            os.replace(tmp, dest)
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+        except BaseException:
+            if os.path.exists(tmp) and expected:
+                self._save_partial(meta_path, href, offset + written, expected)
+            else:
+                for path in (tmp, meta_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+            raise
+        return {"bytes": written, "size": offset + written, "sha256": sha.hexdigest()}
+
+    def remote_hash_folder(self, date_str: str) -> str:
+        """
+        Build a SHA-256 over "name:size:timestamp\\n" for each whitelisted file
+        in DATALOG/<date_str>, using the sizes from the folder listing itself.
+        Files whose size column can't be parsed fall back to a HEAD request.
+        """
+        # 1) Get the DATALOG link
+        datalog = find_entry(self.get_listing("dir"), "DATALOG")
+        if not datalog:
+            raise RuntimeError("Could not find DATALOG link on /dir")
+
+        # 2) Locate the specific date folder
+        folder = find_entry(self.get_listing(datalog["href"]), date_str)
+        if not folder:
+            raise RuntimeError(f"Could not find folder for date {date_str}")
+
+        # 3) One GET for the folder; HEAD only where the listing has no size
+        sha = hashlib.sha256()
+        for entry in self.get_listing(folder["href"]):
+            if not self.is_wanted(entry):
+                continue
+            size = entry["size"]
+            if size is None:
+                self.log(f"  HEAD {entry['name']} (no size in listing)")
+                size = self.head_size(entry["href"])
+            sha.update(f"{entry['name']}:{size}:{entry['timestamp']}\n".encode("utf-8"))
+        return sha.hexdigest()
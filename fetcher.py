@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# ─── Configuration ─────────────────────────────────────────────────────────────
+FETCH_WORKERS      = 2
+FETCH_RETRIES      = 3
+RETRY_BACKOFF      = 1.0
+MAX_WORKERS        = 4
+MIN_CHUNK          = 8 * 1024
+MAX_CHUNK          = 256 * 1024
+
+logger = logging.getLogger("uploader")
+
+class ThroughputController:
+    """
+    AIMD controller for the card link. Each request reports its bytes,
+    duration and outcome; once a window of `limit` requests completes
+    without errors the allowed parallelism grows by one and the read size
+    doubles, as long as aggregate bytes/sec keeps improving. Any error
+    halves both. The EzShare server falls over when pushed too hard, so
+    this finds the most the card tolerates on tonight's signal.
+    """
+
+    def __init__(self, start_workers=FETCH_WORKERS, max_workers=MAX_WORKERS,
+                 min_chunk=MIN_CHUNK, max_chunk=MAX_CHUNK, client=None, log=None):
+        self.max_workers = max(1, max_workers)
+        self.limit = min(max(1, start_workers), self.max_workers)
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.client = client
+        self.chunk_size = getattr(client, "chunk_size", min_chunk)
+        self.log = log or logger.info
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._raised = False
+        self._last_rate = 0.0
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._window_count = 0
+
+    def _set(self, limit, chunk_size, reason):
+        limit = min(max(1, limit), self.max_workers)
+        chunk_size = min(max(self.min_chunk, chunk_size), self.max_chunk)
+        if (limit, chunk_size) != (self.limit, self.chunk_size):
+            self._raised = limit > self.limit
+            self.limit, self.chunk_size = limit, chunk_size
+            if self.client is not None:
+                self.client.chunk_size = chunk_size
+            self.log(f"⚙️ Link {reason}: {self.operating_point()}")
+
+    def operating_point(self):
+        rate = self._last_rate / 1024
+        err = 100 * self.errors / self.requests if self.requests else 0
+        return (f"{self.limit} worker(s), {self.chunk_size // 1024} KB reads, "
+                f"{rate:.0f} KB/s, {err:.0f}% errors")
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+        return time.monotonic()
+
+    def release(self, started, nbytes, ok):
+        with self._cond:
+            self._in_flight -= 1
+            self.requests += 1
+            self.bytes += nbytes
+            if not ok:
+                self.errors += 1
+                self._set(self.limit // 2, self.chunk_size // 2, "backing off")
+                self._reset_window()
+            else:
+                self._window_bytes += nbytes
+                self._window_count += 1
+                if self._window_count >= self.limit and self._window_bytes:
+                    rate = self._window_bytes / max(time.monotonic() - self._window_start, 1e-6)
+                    if self._raised and rate < self._last_rate * 1.05:
+                        # More parallelism didn't buy throughput; settle back
+                        self._last_rate = rate
+                        self._set(self.limit - 1, self.chunk_size, "settling")
+                        self._raised = False
+                    else:
+                        self._last_rate = rate
+                        self._set(self.limit + 1, self.chunk_size * 2, "speeding up")
+                    self._reset_window()
+            self._cond.notify_all()
+
+class FetchScheduler:
+    """
+    Runs card requests (folder listings, file downloads) on a small thread
+    pool. At most `workers` requests are in flight at once, each item is
+    retried on its own with exponential backoff, and results come back in
+    the same order as the input so callers stay deterministic.
+    """
+
+    def __init__(self, workers=FETCH_WORKERS, retries=FETCH_RETRIES,
+                 backoff=RETRY_BACKOFF, controller=None, log=None):
+        self.controller = controller
+        self.workers = controller.max_workers if controller else max(1, workers)
+        self.retries = max(1, retries)
+        self.backoff = backoff
+        self.log = log or logger.info
+
+    def _call(self, fn, item, measure):
+        if self.controller is None:
+            return fn(item)
+        started = self.controller.acquire()
+        try:
+            value = fn(item)
+        except Exception:
+            self.controller.release(started, 0, False)
+            raise
+        self.controller.release(started, measure(value), True)
+        return value
+
+    def _attempt(self, fn, item, label, measure):
+        for attempt in range(1, self.retries + 1):
+            try:
+                return {"item": item, "ok": True, "value": self._call(fn, item, measure),
+                        "error": None, "attempts": attempt}
+            except Exception as e:
+                if attempt == self.retries:
+                    self.log(f"❌ {label(item)} failed after {attempt} attempts: {e}")
+                    return {"item": item, "ok": False, "value": None,
+                            "error": e, "attempts": attempt}
+                delay = self.backoff * 2 ** (attempt - 1)
+                self.log(f"⚠️  {label(item)} failed ({e}); retry {attempt}/{self.retries - 1} in {delay:.0f}s")
+                time.sleep(delay)
+
+    def run(self, items, fn, label=str, measure=lambda value: 0):
+        """
+        Call fn(item) for every item and return one result dict
+        {"item", "ok", "value", "error", "attempts"} per item, in input order.
+        measure(value) gives the bytes moved, for the throughput controller.
+        """
+        items = list(items)
+        if self.workers == 1 or len(items) <= 1:
+            return [self._attempt(fn, item, label, measure) for item in items]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(lambda item: self._attempt(fn, item, label, measure), items))
+
+    def list_folders(self, card, folders):
+        """
+        Fetch several listings concurrently. folders maps a local folder
+        name to its card href; returns {folder: entries}.
+        """
+        results = self.run(folders.items(), lambda kv: card.get_listing(kv[1]),
+                           label=lambda kv: f"Listing {kv[0] or '/'}")
+        failed = [r["item"][0] for r in results if not r["ok"]]
+        if failed:
+            raise RuntimeError(f"Could not list {', '.join(failed)}")
+        return {r["item"][0]: r["value"] for r in results}
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-memory index of the downloads/ tree for web.py's file explorer: one
+os.scandir walk yields every folder's entries with size and mtime plus
+per-folder totals, reused until the next sync changes the tree.
+"""
+import os
+import threading
+from datetime import datetime
+
+# ─── Configuration ─────────────────────────────────────────────────────────────
+PAGE_SIZE          = 200
+MAX_PAGE_SIZE      = 1000
+STAMP_FILE         = "manifest.json"   # rewritten by every sync that fetched files
+
+def _day(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d") if ts is not None else None
+
+def _summary(totals):
+    """
+    Folder totals as served: file count, bytes and the mtime date range.
+    """
+    return {"files": totals["files"], "bytes": totals["bytes"],
+            "first": _day(totals["oldest"]), "last": _day(totals["newest"])}
+
+class DirIndex:
+    """
+    Walks `root` once and answers folder listings from memory. The index is
+    rebuilt when invalidate() is called (web.py does after a sync job) or
+    when `stamp_file` changed since the last walk, which covers syncs run
+    from cron or --daemon.
+    """
+
+    def __init__(self, root, stamp_file=STAMP_FILE):
+        self.root = os.path.abspath(root)
+        self.stamp_file = stamp_file
+        self._lock = threading.Lock()
+        self._dirs = None
+        self._stamp = None
+
+    def invalidate(self):
+        with self._lock:
+            self._dirs = None
+
+    def _stamp_now(self):
+        try:
+            return os.stat(self.stamp_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def _walk(self, path, dirs):
+        """
+        Index `path` and everything below it; returns its totals.
+        """
+        entries = []
+        totals = {"files": 0, "bytes": 0, "oldest": None, "newest": None}
+        try:
+            with os.scandir(path) as it:
+                children = sorted(it, key=lambda e: e.name)
+        except OSError:
+            children = []
+        for e in children:
+            try:
+                st = e.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if e.is_dir(follow_symlinks=False):
+                sub = self._walk(e.path, dirs)
+                entries.append({"name": e.name, "path": e.path, "is_dir": True,
+                                "mtime": st.st_mtime, "totals": sub})
+                files, size, oldest, newest = sub["files"], sub["bytes"], sub["oldest"], sub["newest"]
+            else:
+                entries.append({"name": e.name, "path": e.path, "is_dir": False,
+                                "size": st.st_size, "mtime": st.st_mtime})
+                files, size, oldest, newest = 1, st.st_size, st.st_mtime, st.st_mtime
+            totals["files"] += files
+            totals["bytes"] += size
+            if oldest is not None:
+                totals["oldest"] = min(oldest, totals["oldest"] or oldest)
+                totals["newest"] = max(newest, totals["newest"] or newest)
+        dirs[path] = {"entries": entries, "totals": totals}
+        return totals
+
+    def _current(self):
+        stamp = self._stamp_now()
+        with self._lock:
+            if self._dirs is None or stamp != self._stamp:
+                dirs = {}
+                self._walk(self.root, dirs)
+                self._dirs, self._stamp = dirs, stamp
+            return self._dirs
+
+    def listing(self, path, offset=0, limit=PAGE_SIZE):
+        """
+        One page of a folder below root, or None for paths outside it or
+        not in the index. Entries carry size/mtime (files) or totals
+        (folders); the folder's own totals come along too.
+        """
+        path = os.path.abspath(path)
+        if path != self.root and not path.startswith(self.root + os.sep):
+            return None
+        folder = self._current().get(path)
+        if folder is None:
+            return None
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, offset)
+        page = [dict(e, totals=_summary(e["totals"])) if e["is_dir"] else e
+                for e in folder["entries"][offset:offset + limit]]
+        return {
+            "path": path,
+            "entries": page,
+            "offset": offset,
+            "total": len(folder["entries"]),
+            "totals": _summary(folder["totals"]),
+        }
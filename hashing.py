@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+SHA-256 digests of local files, cached by (path, size, mtime) so a repeat
+request costs one stat() unless the file changed. Misses are hashed in
+parallel with large reads; hashlib releases the GIL while hashing, so the
+threads really do overlap.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+
+# ─── Configuration ─────────────────────────────────────────────────────────────
+DIGEST_CACHE_FILE  = "digests.json"
+HASH_BUFFER        = 1024 * 1024
+HASH_WORKERS       = 4
+
+logger = logging.getLogger("uploader")
+
+def hash_file(path, buffer_size=HASH_BUFFER):
+    sha = hashlib.sha256()
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            sha.update(view[:n])
+    return sha.hexdigest()
+
+class DigestCache:
+    """
+    Persistent {path: [size, mtime_ns, sha256]} map. Digests computed
+    elsewhere (e.g. while a file streamed in) can be handed over with
+    remember() so the file is never read back just to hash it.
+    """
+
+    def __init__(self, path=DIGEST_CACHE_FILE, workers=HASH_WORKERS, log=None):
+        self.path = path
+        self.workers = workers
+        self.log = log or logger.info
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            with open(path) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = dict(self._entries)
+            self._dirty = False
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(entries, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def _lookup(self, path, st):
+        cached = self._entries.get(path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        return None
+
+    def _store(self, path, st, digest):
+        with self._lock:
+            self._entries[path] = [st.st_size, st.st_mtime_ns, digest]
+            self._dirty = True
+
+    def remember(self, path, digest):
+        self._store(path, os.stat(path), digest)
+
+    def forget(self, path):
+        with self._lock:
+            if self._entries.pop(path, None):
+                self._dirty = True
+
+    def digest(self, path):
+        st = os.stat(path)
+        digest = self._lookup(path, st)
+        if digest is None:
+            digest = hash_file(path)
+            self._store(path, st, digest)
+        return digest
+
+    @metrics.span("hash")
+    def digests(self, paths):
+        """
+        {path: sha256} for every path that exists; cache misses are hashed
+        on up to `workers` threads.
+        """
+        result, misses = {}, []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            digest = self._lookup(path, st)
+            if digest is None:
+                misses.append(path)
+            else:
+                result[path] = digest
+        if misses:
+            self.log(f"#️⃣ Hashing {len(misses)} local file(s) not in the digest cache")
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(misses)))) as pool:
+                for path, digest in zip(misses, pool.map(self.digest, misses)):
+                    result[path] = digest
+        return result
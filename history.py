@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite store for sync runs: one row per sleep.py run with its outcome,
+duration, per-phase timings, file and byte counts. Replaces the JSON lines
+in upload_history.json, which are imported once on first use.
+"""
+import os
+import json
+import sqlite3
+import threading
+
+# ─── Configuration ─────────────────────────────────────────────────────────────
+HISTORY_DB         = "history.db"
+LEGACY_HISTORY     = "upload_history.json"
+PAGE_SIZE          = 50
+SCHEMA_VERSION     = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id           INTEGER PRIMARY KEY,
+    started      TEXT NOT NULL,       -- ISO timestamp (UTC) the run started
+    date         TEXT,                -- newest DATALOG night uploaded
+    hash         TEXT,
+    status       TEXT NOT NULL,       -- success | unchanged | error
+    duration_sec REAL,
+    files        INTEGER,
+    bytes        INTEGER,
+    phases       TEXT,                -- JSON {phase: seconds}
+    error        TEXT,
+    metrics      TEXT                 -- JSON metrics.Metrics.collect() snapshot
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+"""
+
+_lock = threading.Lock()
+
+def connect(path=HISTORY_DB, legacy=LEGACY_HISTORY):
+    """
+    Open the store, creating the schema and importing the legacy JSON
+    lines the first time.
+    """
+    db = sqlite3.connect(path, timeout=10)
+    db.row_factory = sqlite3.Row
+    with _lock, db:
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            db.executescript(SCHEMA)
+            import_legacy(db, legacy)
+        elif version < 2:
+            db.execute("ALTER TABLE runs ADD COLUMN metrics TEXT")
+        if version < SCHEMA_VERSION:
+            db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return db
+
+def import_legacy(db, legacy=LEGACY_HISTORY):
+    """
+    Copy upload_history.json lines into the runs table. The file is left
+    in place; the schema version keeps this from running twice.
+    """
+    if not os.path.exists(legacy):
+        return 0
+    rows = []
+    with open(legacy) as f:
+        for line in f:
+            try:
+                e = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            rows.append((e.get("timestamp"), e.get("date"), e.get("hash"),
+                         e.get("status", "success"), e.get("duration_sec")))
+    db.executemany("INSERT INTO runs (started, date, hash, status, duration_sec) "
+                   "VALUES (?, ?, ?, ?, ?)", [r for r in rows if r[0]])
+    return len(rows)
+
+def record_run(started, status, date=None, folder_hash=None, duration_sec=None,
+               files=None, nbytes=None, phases=None, error=None, metrics=None, path=HISTORY_DB):
+    db = connect(path)
+    try:
+        with db:
+            cur = db.execute(
+                "INSERT INTO runs (started, date, hash, status, duration_sec, files, bytes, phases, error, metrics) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (started, date, folder_hash, status, duration_sec, files, nbytes,
+                 json.dumps(phases) if phases is not None else None, error,
+                 json.dumps(metrics) if metrics is not None else None))
+        return cur.lastrowid
+    finally:
+        db.close()
+
+def _row(row):
+    run = dict(row)
+    run["phases"] = json.loads(run["phases"]) if run["phases"] else {}
+    run["metrics"] = json.loads(run["metrics"]) if run["metrics"] else None
+    return run
+
+def _range(start, end):
+    """
+    WHERE clause for an inclusive [start, end] range of YYYY-MM-DD days.
+    """
+    clauses, args = [], []
+    if start:
+        clauses.append("started >= ?")
+        args.append(start)
+    if end:
+        clauses.append("started < ?")
+        args.append(end + "T99")      # sorts after every time on that day
+    return clauses, args
+
+def list_runs(db, start=None, end=None, before=None, limit=PAGE_SIZE):
+    """
+    Newest runs first. Page with `before` = the last id of the previous
+    page (keyset paging, so deep pages cost the same as the first).
+    Returns (runs, next_before) where next_before is None on the last page.
+    """
+    clauses, args = _range(start, end)
+    if before:
+        clauses.append("id < ?")
+        args.append(before)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = db.execute(f"SELECT * FROM runs {where} ORDER BY id DESC LIMIT ?",
+                      args + [limit + 1]).fetchall()
+    runs = [_row(r) for r in rows[:limit]]
+    return runs, (runs[-1]["id"] if len(rows) > limit else None)
+
+def weekly_stats(db, start=None, end=None):
+    """
+    Per week (SQLite %W, weeks start on Monday): run count, uploads, failures, success
+    rate (share of runs that did not fail), average duration and bytes of
+    runs that uploaded.
+    """
+    clauses, args = _range(start, end)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = db.execute(f"""
+        SELECT strftime('%Y-W%W', started)                      AS week,
+               COUNT(*)                                         AS runs,
+               SUM(status = 'success')                          AS uploads,
+               SUM(status = 'error')                            AS failures,
+               ROUND(AVG(status != 'error'), 3)                 AS success_rate,
+               ROUND(AVG(CASE WHEN status = 'success' THEN duration_sec END), 1) AS avg_duration_sec,
+               SUM(CASE WHEN status = 'success' THEN COALESCE(bytes, 0) ELSE 0 END) AS bytes
+        FROM runs {where}
+        GROUP BY week ORDER BY week DESC
+    """, args).fetchall()
+    return [dict(r) for r in rows]
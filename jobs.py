@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Background runner for syncs started from web.py: one sleep.py subprocess at
+a time, with progress read from the file sleep.py keeps updated.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import subprocess
+from collections import OrderedDict, deque
+
+# ─── Configuration ─────────────────────────────────────────────────────────────
+SYNC_SCRIPT        = "sleep.py"
+PROGRESS_FILE      = "sync_progress.json"     # written by sleep.report_progress()
+KEEP_JOBS          = 20                       # finished jobs kept for lookups
+OUTPUT_LINES       = 200                      # tail of subprocess output per job
+
+def read_progress(path=PROGRESS_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def estimate_eta(progress):
+    """
+    Seconds left in the download phase, from the byte rate so far.
+    None outside the download phase or before the first file lands.
+    """
+    done = progress.get("bytes_done") or 0
+    total = progress.get("bytes_total") or 0
+    since = progress.get("download_started")
+    if progress.get("phase") != "download" or not done or not since:
+        return None
+    elapsed = progress.get("updated", time.time()) - since
+    if elapsed <= 0:
+        return None
+    return round(max(total - done, 0) / (done / elapsed))
+
+class SyncJobs:
+    """
+    Runs `sleep.py --force-date <date>` in a worker thread. Only one sync
+    runs at a time: submit() while one is active hands back the active job
+    instead of starting another. on_finish(job_id) is called after each
+    sync exits.
+    """
+
+    def __init__(self, script=SYNC_SCRIPT, progress_file=PROGRESS_FILE, keep=KEEP_JOBS, on_finish=None):
+        self.script = script
+        self.on_finish = on_finish
+        self.progress_file = progress_file
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._active = None
+
+    def submit(self, date):
+        """
+        Returns (job_id, created). created is False when a sync was already
+        running; job_id is then the running job's id.
+        """
+        with self._lock:
+            if self._active:
+                return self._active, False
+            job_id = uuid.uuid4().hex[:12]
+            self._jobs[job_id] = {
+                "id": job_id, "date": date, "status": "running",
+                "submitted": time.time(), "finished": None, "returncode": None,
+                "progress": {}, "output": deque(maxlen=OUTPUT_LINES),
+            }
+            self._active = job_id
+            while len(self._jobs) > self.keep:
+                self._jobs.popitem(last=False)
+        threading.Thread(target=self._run, args=(job_id, date), daemon=True).start()
+        return job_id, True
+
+    def _run(self, job_id, date):
+        job = self._jobs[job_id]
+        try:
+            # Don't report the previous run's progress as this one's
+            if os.path.exists(self.progress_file):
+                os.remove(self.progress_file)
+            proc = subprocess.Popen(
+                [sys.executable, self.script, "--force-date", date],
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+            )
+            for line in proc.stdout:
+                with self._lock:
+                    job["output"].append(line)
+            returncode = proc.wait()
+        except Exception as e:
+            job["output"].append(f"❌ Could not run {self.script}: {e}\n")
+            returncode = -1
+        progress = read_progress(self.progress_file)
+        with self._lock:
+            job["progress"] = progress
+            job["returncode"] = returncode
+            job["finished"] = time.time()
+            job["status"] = "success" if returncode == 0 and progress.get("phase") == "done" else "error"
+            self._active = None
+        if self.on_finish:
+            self.on_finish(job_id)
+
+    def active(self):
+        return self._active
+
+    def get(self, job_id):
+        """
+        JSON-ready snapshot of a job with its live progress and ETA,
+        or None for an unknown id.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return None
+            snap = dict(job, output="".join(job["output"]))
+            running = job_id == self._active
+        snap["progress"] = read_progress(self.progress_file) if running else dict(job["progress"])
+        snap["progress"]["eta_sec"] = estimate_eta(snap["progress"]) if running else None
+        return snap
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Tiny in-process instrumentation: counters, latency histograms and timed
+spans, collected per sync run and folded into cumulative totals that
+web.py serves in the Prometheus text format at /metrics.
+"""
+import os
+import re
+import json
+import time
+import threading
+import functools
+from urllib.parse import urlparse
+
+# ─── Configuration ─────────────────────────────────────────────────────────────
+METRICS_FILE       = "metrics.json"   # cumulative totals over all runs
+PREFIX             = "sleephq_uploader_"
+BUCKETS            = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+ENDPOINTS          = [                # URL path → endpoint label
+    (r"^/dir$",                   "card_listing"),
+    (r"^/download$",              "card_download"),
+    (r"^/oauth/token$",           "oauth"),
+    (r"^/api/v1/teams$",          "teams"),
+    (r"/imports$",                "imports"),
+    (r"/files$",                  "files"),
+    (r"/process_files$",          "process_files"),
+]
+HELP               = {
+    "http_requests_total":         "HTTP requests by endpoint and status",
+    "http_request_bytes_total":    "Request body bytes sent by endpoint",
+    "http_response_bytes_total":   "Response bytes declared by Content-Length, by endpoint",
+    "http_request_seconds":        "Time to response headers by endpoint",
+    "span_seconds":                "Time spent in an instrumented step (overlapping calls add up)",
+    "runs_total":                  "Sync runs by outcome",
+    "last_run_timestamp_seconds":  "When the last run finished",
+    "last_run_duration_seconds":   "Wall time of the last run",
+    "last_run_phase_seconds":      "Wall time per phase of the last run",
+}
+
+def series(name, **labels):
+    """
+    Prometheus series key: name{k="v",...} with sorted labels.
+    """
+    if not labels:
+        return PREFIX + name
+    inner = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return f"{PREFIX}{name}{{{inner}}}"
+
+def endpoint(url):
+    path = urlparse(url).path
+    for pattern, label in ENDPOINTS:
+        if re.search(pattern, path):
+            return label
+    return "other"
+
+class Metrics:
+    """
+    Thread-safe registry for one run. collect() hands the values over and
+    starts afresh.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = series(name, **labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = series(name, **labels)
+        with self._lock:
+            h = self._histograms.setdefault(key, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    h["buckets"][i] += 1
+            h["sum"] += seconds
+            h["count"] += 1
+
+    def span(self, name):
+        """
+        Decorator timing every call of a function as span_seconds{span=name}.
+        """
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe("span_seconds", time.perf_counter() - started, span=name)
+            return wrapper
+        return decorate
+
+    def instrument(self, session):
+        """
+        Count requests, bytes and header latency for every response a
+        requests.Session receives.
+        """
+        def on_response(r, *args, **kwargs):
+            label = endpoint(r.url)
+            self.inc("http_requests_total", endpoint=label, status=r.status_code)
+            self.observe("http_request_seconds", r.elapsed.total_seconds(), endpoint=label)
+            body = r.request.body
+            if isinstance(body, (bytes, str)):
+                self.inc("http_request_bytes_total", len(body), endpoint=label)
+            if r.headers.get("Content-Length", "").isdigit():
+                self.inc("http_response_bytes_total", int(r.headers["Content-Length"]), endpoint=label)
+        session.hooks["response"].append(on_response)
+        return session
+
+    def collect(self):
+        with self._lock:
+            snap = {"counters": self._counters, "histograms": self._histograms}
+            self._counters, self._histograms = {}, {}
+        return snap
+
+def load_totals(path=METRICS_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"counters": {}, "histograms": {}, "gauges": {}}
+
+def persist_run(snap, status, duration_sec, phases, path=METRICS_FILE):
+    """
+    Fold one run's snapshot into the cumulative totals file and set the
+    last-run gauges.
+    """
+    totals = load_totals(path)
+    snap["counters"][series("runs_total", status=status)] = 1
+    for key, value in snap["counters"].items():
+        totals["counters"][key] = totals["counters"].get(key, 0) + value
+    for key, h in snap["histograms"].items():
+        t = totals["histograms"].setdefault(key, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+        t["buckets"] = [a + b for a, b in zip(t["buckets"], h["buckets"])]
+        t["sum"] += h["sum"]
+        t["count"] += h["count"]
+    gauges = {series("last_run_timestamp_seconds"): round(time.time()),
+              series("last_run_duration_seconds"): duration_sec}
+    for phase, seconds in (phases or {}).items():
+        gauges[series("last_run_phase_seconds", phase=phase)] = seconds
+    totals["gauges"] = gauges
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(totals, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+def _name(key):
+    return key.split("{", 1)[0]
+
+def _bucket(key, le):
+    """
+    name{labels} → name_bucket{labels,le="..."}
+    """
+    name, _, rest = key.partition("{")
+    labels = rest[:-1] + "," if rest else ""
+    return f'{name}_bucket{{{labels}le="{le}"}}'
+
+def render(totals):
+    """
+    Prometheus text exposition (version 0.0.4) of the totals.
+    """
+    lines, typed = [], set()
+
+    def header(key, kind):
+        name = _name(key)
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# HELP {name} {HELP.get(name[len(PREFIX):], name)}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for key in sorted(totals["counters"]):
+        header(key, "counter")
+        lines.append(f"{key} {totals['counters'][key]}")
+    for key in sorted(totals.get("gauges", {})):
+        header(key, "gauge")
+        lines.append(f"{key} {totals['gauges'][key]}")
+    for key in sorted(totals["histograms"]):
+        h = totals["histograms"][key]
+        header(key, "histogram")
+        for bound, count in zip(BUCKETS, h["buckets"]):
+            lines.append(f"{_bucket(key, bound)} {count}")
+        lines.append(f"{_bucket(key, '+Inf')} {h['count']}")
+        name, _, rest = key.partition("{")
+        suffix = "{" + rest if rest else ""
+        lines.append(f"{name}_sum{suffix} {round(h['sum'], 6)}")
+        lines.append(f"{name}_count{suffix} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+metrics = Metrics()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-ins for the EzShare card and the SleepHQ API, so sleep.py can
+be exercised and benchmarked without the real card or a Wi-Fi switch.
+
+    python3 simulator.py --nights 7 --latency 0.05 --bandwidth-kbps 800
+
+serves the card on http://127.0.0.1:8001 and SleepHQ on
+http://127.0.0.1:8002; point EZSHARE_BASE / SLEEPHQ_BASE in sleep.py at
+them (bench.py does this for you).
+"""
+import re
+import time
+import json
+import random
+import argparse
+import threading
+from datetime import date, timedelta
+from urllib.parse import urlparse, parse_qs, quote, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ─── Configuration ─────────────────────────────────────────────────────────────
+EZSHARE_PORT       = 8001
+SLEEPHQ_PORT       = 8002
+NIGHT_FILES        = {              # suffix → size in bytes for one night
+    "BRP.edf": 2_400_000,
+    "PLD.edf":   450_000,
+    "SAD.edf":   120_000,
+    "EVE.edf":     6_000,
+    "CSL.edf":     2_000,
+}
+ROOT_FILES         = {"STR.edf": 300_000, "Identification.json": 1_200, "Identification.crc": 4}
+SETTINGS_FILES     = {"CurrentSettings.json": 3_000, "CurrentSettings.crc": 4}
+POOL_SIZE          = 1024 * 1024
+
+class Stats:
+    """
+    Thread-safe request and byte counters per endpoint kind.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.bytes_out = {}
+            self.bytes_in = {}
+
+    def add(self, kind, sent=0, received=0):
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            self.bytes_out[kind] = self.bytes_out.get(kind, 0) + sent
+            self.bytes_in[kind] = self.bytes_in.get(kind, 0) + received
+
+    def snapshot(self):
+        with self._lock:
+            return {k: {"requests": n, "bytes_out": self.bytes_out.get(k, 0),
+                        "bytes_in": self.bytes_in.get(k, 0)}
+                    for k, n in sorted(self.requests.items())}
+
+class CardImage:
+    """
+    Synthetic SD card: root files, SETTINGS and `nights` DATALOG folders.
+    File bodies are deterministic slices of one shared pool, half random and
+    half zeros so they compress roughly like real EDF data.
+    """
+
+    def __init__(self, nights=7, first_night=None, seed=1):
+        rng = random.Random(seed)
+        self.pool = rng.randbytes(POOL_SIZE // 2) + bytes(POOL_SIZE // 2)
+        self.files = {}
+        self.mtimes = {}
+        first = first_night or date.today() - timedelta(days=nights)
+        for name, size in ROOT_FILES.items():
+            self.add(name, size, first)
+        for name, size in SETTINGS_FILES.items():
+            self.add(f"SETTINGS/{name}", size, first)
+        for i in range(nights):
+            night = first + timedelta(days=i)
+            stamp = night.strftime("%Y%m%d")
+            for suffix, size in NIGHT_FILES.items():
+                self.add(f"DATALOG/{stamp}/{stamp}_223000_{suffix}", size, night)
+
+    def add(self, path, size, day):
+        self.files[path] = (len(self.files) * 7919 % POOL_SIZE, size)
+        self.mtimes[path] = day
+
+    def body(self, path):
+        offset, size = self.files[path]
+        out = bytearray()
+        while len(out) < size:
+            take = min(size - len(out), POOL_SIZE - offset)
+            out += self.pool[offset:offset + take]
+            offset = 0
+        return bytes(out)
+
+    def listing(self, folder):
+        folder = folder.strip("/")
+        dirs, files = set(), []
+        for path in sorted(self.files):
+            parent, _, name = path.rpartition("/")
+            if parent == folder:
+                files.append(path)
+            elif path.startswith(folder + "/" if folder else ""):
+                rest = path[len(folder) + 1:] if folder else path
+                dirs.add(rest.split("/")[0])
+        lines = []
+        for d in sorted(dirs):
+            full = f"{folder}/{d}" if folder else d
+            lines.append(f"   2025- 1- 1    0:00:00         &lt;DIR&gt;   "
+                         f"<a href=\"dir?dir=A:%5C{quote(full.replace('/', chr(92)))}\"> {d}</a>")
+        for path in files:
+            day = self.mtimes[path]
+            kb = max(1, -(-self.files[path][1] // 1024))
+            lines.append(f"   {day.year}-{day.month:>2}-{day.day:>2}   23:59:00 {kb:>9}KB  "
+                         f"<a href=\"download?file={quote(path.replace('/', chr(92)))}\"> {path.rpartition('/')[2]}</a>")
+        title = "A:\\" + folder.replace("/", "\\")
+        return (f"<html><head><title>ez Share</title></head><body><h1>Directory Index of {title}</h1>"
+                "<pre>\n" + "<br>\n".join(lines) + "\n</pre></body></html>").encode("utf-8")
+
+def _read_body(handler):
+    """
+    Read a request body sent with Content-Length or chunked encoding.
+    """
+    if handler.headers.get("Transfer-Encoding", "").lower() == "chunked":
+        total = 0
+        while True:
+            size = int(handler.rfile.readline().split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                handler.rfile.readline()
+                return total
+            total += len(handler.rfile.read(size))
+            handler.rfile.readline()
+    length = int(handler.headers.get("Content-Length", "0"))
+    return len(handler.rfile.read(length)) if length else 0
+
+def make_ezshare_handler(card, stats, latency=0.0, bandwidth_kbps=0, drop_rate=0.0, seed=2):
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    class EzShareHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _resolve(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == "/dir":
+                folder = unquote(query.get("dir", ["A:"])[0])[2:].replace("\\", "/")
+                return "listing", card.listing(folder)
+            if url.path == "/download":
+                path = unquote(query.get("file", [""])[0]).replace("\\", "/")
+                if path in card.files:
+                    return "download", card.body(path)
+            return "missing", None
+
+        def _send(self, head_only):
+            if latency:
+                time.sleep(latency)
+            kind, body = self._resolve()
+            if body is None:
+                stats.add(kind)
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status, start, total = 200, 0, len(body)
+            m = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+            if m and kind == "download":
+                start = int(m.group(1))
+                if start >= total:
+                    stats.add(kind)
+                    self.send_response(416)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                status = 206
+            payload = body[start:]
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html" if kind == "listing" else "application/octet-stream")
+            self.send_header("Content-Length", str(len(payload)))
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{total - 1}/{total}")
+            self.end_headers()
+            if head_only:
+                stats.add("head")
+                return
+            with rng_lock:
+                drop_at = int(len(payload) * rng.random()) if rng.random() < drop_rate else None
+            sent = self._write(payload, drop_at)
+            stats.add(kind, sent=sent)
+            if drop_at is not None:
+                self.close_connection = True
+
+        def _write(self, payload, drop_at):
+            step = 8192
+            rate = bandwidth_kbps * 1000 / 8
+            sent = 0
+            limit = len(payload) if drop_at is None else drop_at
+            started = time.monotonic()
+            try:
+                while sent < limit:
+                    block = payload[sent:min(sent + step, limit)]
+                    self.wfile.write(block)
+                    sent += len(block)
+                    if rate:
+                        ahead = sent / rate - (time.monotonic() - started)
+                        if ahead > 0:
+                            time.sleep(ahead)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            return sent
+
+        def do_GET(self):
+            self._send(head_only=False)
+
+        def do_HEAD(self):
+            self._send(head_only=True)
+
+    return EzShareHandler
+
+def make_sleephq_handler(stats, latency=0.0):
+    counter = {"import": 0}
+    lock = threading.Lock()
+
+    class SleepHQHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, kind, payload, received=0, status=200):
+            body = json.dumps(payload).encode("utf-8")
+            stats.add(kind, sent=len(body), received=received)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            if urlparse(self.path).path == "/api/v1/teams":
+                return self._json("teams", {"data": [{"id": "1", "attributes": {"name": "Simulated"}}]})
+            self._json("missing", {}, status=404)
+
+        def do_POST(self):
+            if latency:
+                time.sleep(latency)
+            received = _read_body(self)
+            path = urlparse(self.path).path
+            if path == "/oauth/token":
+                return self._json("oauth", {
+                    "access_token": "sim-access", "refresh_token": "sim-refresh",
+                    "token_type": "Bearer", "expires_in": 7200, "created_at": int(time.time()),
+                }, received)
+            if re.fullmatch(r"/api/v1/teams/\w+/imports", path):
+                with lock:
+                    counter["import"] += 1
+                    import_id = str(counter["import"])
+                return self._json("imports", {"data": {"id": import_id}}, received, status=201)
+            if re.fullmatch(r"/api/v1/imports/\w+/files", path):
+                return self._json("files", {"data": {"id": "f"}}, received, status=201)
+            if re.fullmatch(r"/api/v1/imports/\w+/process_files", path):
+                return self._json("process_files", {"data": {}}, received)
+            self._json("missing", {}, received, status=404)
+
+    return SleepHQHandler
+
+def serve(handler, port, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def start(nights=7, latency=0.0, bandwidth_kbps=0, drop_rate=0.0,
+          ezshare_port=EZSHARE_PORT, sleephq_port=SLEEPHQ_PORT, sleephq_latency=0.0):
+    """
+    Start both simulators in background threads.
+    Returns (card, stats, ezshare_server, sleephq_server).
+    """
+    card = CardImage(nights)
+    stats = Stats()
+    ez = serve(make_ezshare_handler(card, stats, latency, bandwidth_kbps, drop_rate), ezshare_port)
+    hq = serve(make_sleephq_handler(stats, sleephq_latency), sleephq_port)
+    return card, stats, ez, hq
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated EzShare card and SleepHQ API")
+    parser.add_argument("--nights", type=int, default=7)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every card request")
+    parser.add_argument("--bandwidth-kbps", type=float, default=0, help="per-connection cap, 0 = unlimited")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="chance a card transfer is cut short")
+    parser.add_argument("--ezshare-port", type=int, default=EZSHARE_PORT)
+    parser.add_argument("--sleephq-port", type=int, default=SLEEPHQ_PORT)
+    args = parser.parse_args()
+    card, stats, _, _ = start(args.nights, args.latency, args.bandwidth_kbps, args.drop_rate,
+                              args.ezshare_port, args.sleephq_port)
+    print(f"EzShare on http://127.0.0.1:{args.ezshare_port} ({len(card.files)} files), "
+          f"SleepHQ on http://127.0.0.1:{args.sleephq_port}. Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(stats.snapshot(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,32 @@
 #!/usr/bin/env python3
 import os
 import logging
+import logging.handlers
 import sys
 import json
 import time
-import shutil
+import fcntl
 import hashlib
-import zipfile
+import shutil
+import uuid
+import threading
 import requests
 from datetime import datetime
+from requests.adapters import HTTPAdapter
 from urllib.parse import unquote
-from bs4 import BeautifulSoup
+from ezshare import EzShareClient, find_entry
+from fetcher import FetchScheduler, ThroughputController
+import wifi
+import history
+from hashing import DigestCache
+from store import ObjectStore, link_or_copy
+import metrics as metrics_store
+from metrics import metrics
+from archive import ZipPipeline, iter_zip, write_zip
 
 # ─── Configuration ─────────────────────────────────────────────────────────────
 EZSHARE_BASE       = "http://192.168.4.1"
+SLEEPHQ_BASE       = "https://sleephq.com"
 DOWNLOAD_DIR       = "downloads"
 ZIP_OUTPUT         = "cpapdata.zip"
 WHITELIST          = [".edf", ".crc", ".json", ".tgt", ".log"]
@@ -21,67 +34,29 @@ EZSHARE_PROFILE    = "ezshare"
 HOME_WIFI_PROFILE  = "homewifi"
 UPLOAD_STATE_FILE  = "upload_state.txt"
 LOG_FILE           = "uploader.log"
-
-def resolve_url(href: str) -> str:
-    """
-    Resolve an EzShare listing href to a full URL.
-    """
-    href = href.strip()
-    if href.lower().startswith("http"):
-        return href
-    return f"{EZSHARE_BASE.rstrip('/')}/{href.lstrip('/')}"
-
-def remote_hash_folder(date_str: str) -> str:
-    """
-    HEAD each whitelisted file in DATALOG/<date_str> and
-    build a SHA-256 over "name:size\n" entries.
-    """
-    log(f"START remote_hash_folder({date_str})")
-    
-    # 1) Get the DATALOG link
-    r = requests.get(f"{EZSHARE_BASE}/dir", timeout=10)
-    r.raise_for_status()
-    root_soup = BeautifulSoup(r.text, "html.parser")
-    datalog_href = next(
-        (a["href"] for a in root_soup.find_all("a") if a.text.strip() == "DATALOG"),
-        None
-    )
-    if not datalog_href:
-        raise RuntimeError("Could not find DATALOG link on /dir")
-
-    # 2) Locate the specific date folder
-    r2 = requests.get(resolve_url(datalog_href), timeout=10)
-    r2.raise_for_status()
-    dl_soup = BeautifulSoup(r2.text, "html.parser")
-    date_href = next(
-        (a["href"] for a in dl_soup.find_all("a") if a.text.strip() == date_str),
-        None
-    )
-    if not date_href:
-        raise RuntimeError(f"Could not find folder for date {date_str}")
-
-    # 3) Scrape that folder and HEAD each file
-    r3 = requests.get(resolve_url(date_href), timeout=10)
-    r3.raise_for_status()
-    ds = BeautifulSoup(r3.text, "html.parser")
-    sha = hashlib.sha256()
-    sess = requests.Session()
-    for a in ds.find_all("a"):
-        name = a.text.strip()
-        href = a.get("href", "")
-        if "download?file=" not in href or not any(name.lower().endswith(ext) for ext in WHITELIST):
-            continue
-        file_url = resolve_url(href)
-        log(f"  HEAD {name} → {file_url}")
-        head = sess.head(file_url, timeout=5)
-        head.raise_for_status()
-        size = head.headers.get("Content-Length", "0")
-        sha.update(f"{name}:{size}\n".encode("utf-8"))
-
-    h = sha.hexdigest()
-    log(f"✅ Remote hash: {h}")
-    log("END remote_hash_folder")
-    return h
+LOG_MAX_BYTES      = 5 * 1024 * 1024   # rotate uploader.log at this size
+LOG_BACKUPS        = 3                 # keep uploader.log.1 … .3
+MANIFEST_FILE      = "manifest.json"
+PLAN_FILE          = "sync_plan.json"
+PROGRESS_FILE      = "sync_progress.json"   # live phase/counters for web.py
+TOKEN_CACHE_FILE   = "sleephq_token.json"
+TOKEN_REFRESH_MARGIN = 600      # refresh this many seconds before expiry
+TOKEN_DEFAULT_TTL  = 7200       # when the token response has no expires_in
+DAEMON_INTERVAL    = 15 * 60    # --daemon: seconds between card polls
+DAEMON_MAX_INTERVAL = 2 * 60 * 60
+SESSION_SETTLE     = 30 * 60    # newest file younger than this = still recording
+BACKFILL_FILE      = "backfill.json"
+BACKFILL_BATCH_BYTES = 50 * 1024 * 1024   # --backfill: nights per import up to about this much
+FETCH_WORKERS      = 2
+FETCH_MAX_WORKERS  = 4
+STREAM_UPLOAD      = True
+UPLOAD_MODE        = "delta"     # "delta": only files SleepHQ hasn't accepted yet; "zip": one archive
+UPLOAD_WORKERS     = 3
+UPLOAD_RETRIES     = 3
+ACCEPTED_FILE      = "accepted_uploads.json"
+ALWAYS_SEND        = {"Identification.json", "Identification.crc", "Identification.tgt"}
+ZIP_COMPRESSION    = "deflate"   # see archive.COMPRESSION_POLICIES / bench_zip.py
+STAGING_DIR        = "staging"   # --from-store builds the upload tree here
 
 # Create a top‐level logger
 logger = logging.getLogger("uploader")
@@ -95,8 +70,46 @@ ch = logging.StreamHandler(sys.stdout)
 ch.setFormatter(formatter)
 logger.addHandler(ch)
 
-# File handler (appends to uploader.log)
-fh = logging.FileHandler(LOG_FILE, mode="a")
+class SharedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler that several sleep.py processes (the timer, jobs
+    started from web.py, --daemon) can share. Each record is written while
+    holding an flock on <log>.lock, so only one process rolls over at a time,
+    and a process whose file was rotated away by another reopens the new one
+    instead of writing on into the backup.
+    """
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, **kwargs)
+        self._lock_file = open(self.baseFilename + ".lock", "a")
+
+    def _reopen_if_rotated(self):
+        if self.stream is None:
+            return
+        try:
+            st = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            st = None
+        ours = os.fstat(self.stream.fileno())
+        if st is None or (st.st_dev, st.st_ino) != (ours.st_dev, ours.st_ino):
+            self.stream.close()
+            self.stream = None      # reopened by shouldRollover()/emit()
+
+    def emit(self, record):
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        except OSError:
+            self.handleError(record)
+            return
+        try:
+            self._reopen_if_rotated()
+            super().emit(record)
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+# File handler (appends to uploader.log, rotated by size)
+fh = SharedRotatingFileHandler(LOG_FILE, mode="a", maxBytes=LOG_MAX_BYTES,
+                               backupCount=LOG_BACKUPS, encoding="utf-8")
 fh.setFormatter(formatter)
 logger.addHandler(fh)
 
@@ -104,36 +117,134 @@ logger.addHandler(fh)
 def log(msg):
     logger.info(msg)
 
-def get_token_from_config():
-    log("START get_token_from_config")
+_sleephq_session = None
+
+def sleephq_session():
+    """
+    One pooled, instrumented session for every SleepHQ call, sized for the
+    concurrent per-file uploads.
+    """
+    global _sleephq_session
+    if _sleephq_session is None:
+        _sleephq_session = metrics.instrument(requests.Session())
+        _sleephq_session.mount("https://", HTTPAdapter(pool_maxsize=UPLOAD_WORKERS))
+        _sleephq_session.mount("http://", HTTPAdapter(pool_maxsize=UPLOAD_WORKERS))
+    return _sleephq_session
+
+def load_credentials():
+    """
+    Cached SleepHQ credentials: access/refresh token, expiry and team id.
+    """
     try:
-        cfg = json.load(open("config.json"))
-        data = {
-            "grant_type":    "password",
+        with open(TOKEN_CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_credentials(creds):
+    tmp = TOKEN_CACHE_FILE + ".tmp"
+    # Tokens are secrets: keep the cache readable by this user only
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(creds, f)
+    os.replace(tmp, TOKEN_CACHE_FILE)
+
+def invalidate_credentials():
+    log("⚠️  Dropping cached SleepHQ token")
+    if os.path.exists(TOKEN_CACHE_FILE):
+        os.remove(TOKEN_CACHE_FILE)
+
+def request_token(cfg, creds):
+    """
+    Refresh creds with their refresh token, falling back to the password
+    grant. Returns the new credentials, keeping the cached team id.
+    """
+    base = {"client_id": cfg["client_id"], "client_secret": cfg["client_secret"], "scope": "read write"}
+    grants = []
+    if creds.get("refresh_token"):
+        grants.append(dict(base, grant_type="refresh_token", refresh_token=creds["refresh_token"]))
+    grants.append(dict(base, grant_type="password", username=cfg["username"], password=cfg["password"]))
+    for data in grants:
+        try:
+            r = sleephq_session().post(f"{SLEEPHQ_BASE}/oauth/token", data=data, timeout=10)
+            r.raise_for_status()
+        except requests.RequestException as e:
+            if data is grants[-1]:
+                raise
+            log(f"⚠️  Token refresh failed ({e}); logging in again")
+            continue
+        body = r.json()
+        issued = body.get("created_at") or time.time()
+        fresh = {
             "client_id":     cfg["client_id"],
-            "client_secret": cfg["client_secret"],
             "username":      cfg["username"],
-            "password":      cfg["password"],
-            "scope":         "read write"
+            "access_token":  body["access_token"],
+            "refresh_token": body.get("refresh_token") or creds.get("refresh_token"),
+            "expires_at":    issued + body.get("expires_in", TOKEN_DEFAULT_TTL),
+            "team_id":       creds.get("team_id"),
         }
-        r = requests.post("https://sleephq.com/oauth/token", data=data, timeout=10)
-        r.raise_for_status()
-        token = r.json()["access_token"]
-        log("✅ Token retrieved")
-        with open("sleephq_token.txt", "w") as f:
-            f.write(token)
-        return token
+        save_credentials(fresh)
+        log(f"✅ Token retrieved ({data['grant_type']} grant)")
+        return fresh
+
+_refresh_thread = None
+
+def _refresh_in_background(cfg, creds):
+    try:
+        request_token(cfg, creds)
+    except Exception as e:
+        log(f"⚠️  Background token refresh failed: {e}")
+
+def wait_for_token_refresh(timeout=15):
+    """
+    Let a background refresh finish before we leave the home network.
+    """
+    if _refresh_thread is not None:
+        _refresh_thread.join(timeout)
+
+@metrics.span("auth")
+def get_token_from_config():
+    """
+    Return a SleepHQ access token, reusing the cached one while it is valid.
+    Within TOKEN_REFRESH_MARGIN of expiry the cached token is still returned
+    and a refresh runs in the background; an expired or missing token is
+    fetched synchronously.
+    """
+    global _refresh_thread
+    log("START get_token_from_config")
+    try:
+        cfg = json.load(open("config.json"))
+        creds = load_credentials()
+        if creds.get("client_id") != cfg["client_id"] or creds.get("username") != cfg["username"]:
+            creds = {}
+        remaining = creds.get("expires_at", 0) - time.time()
+        if remaining > TOKEN_REFRESH_MARGIN:
+            log(f"✅ Using cached token ({remaining / 60:.0f} min left)")
+            return creds["access_token"]
+        if remaining > 0:
+            if _refresh_thread is None or not _refresh_thread.is_alive():
+                log("🔄 Token expires soon; refreshing in the background")
+                _refresh_thread = threading.Thread(
+                    target=_refresh_in_background, args=(cfg, creds), daemon=True)
+                _refresh_thread.start()
+            return creds["access_token"]
+        return request_token(cfg, creds)["access_token"]
     except Exception as e:
         log(f"❌ Failed to retrieve token: {e}")
         return None
     finally:
         log("END get_token_from_config")
 
+@metrics.span("auth")
 def fetch_team_id(token):
     log("START fetch_team_id")
     try:
-        r = requests.get(
-            "https://sleephq.com/api/v1/teams",
+        creds = load_credentials()
+        if creds.get("team_id"):
+            log(f"✅ Using cached team ID {creds['team_id']}")
+            return creds["team_id"]
+        r = sleephq_session().get(
+            f"{SLEEPHQ_BASE}/api/v1/teams",
             headers={"Authorization": f"Bearer {token}"}, timeout=10
         )
         r.raise_for_status()
@@ -143,6 +254,8 @@ def fetch_team_id(token):
             return None
         t = teams[0]
         log(f"✅ Using team {t['attributes']['name']} (ID {t['id']})")
+        if creds:
+            save_credentials(dict(creds, team_id=t["id"]))
         return t["id"]
     except Exception as e:
         log(f"❌ Failed to fetch team ID: {e}")
@@ -150,19 +263,17 @@ def fetch_team_id(token):
     finally:
         log("END fetch_team_id")
 
+@metrics.span("wifi")
 def switch_wifi(profile):
     log(f"START switch_wifi({profile})")
-    res = __import__("subprocess").run(
-        ["nmcli", "connection", "up", profile],
-        capture_output=True, text=True
-    )
-    if res.returncode == 0:
-        log(f"✅ Switched to WiFi: {profile}")
-        time.sleep(5)
+    probe = f"{EZSHARE_BASE}/dir" if profile == EZSHARE_PROFILE else SLEEPHQ_BASE
+    ok, message = wifi.switch_wifi(profile, probe, log)
+    if ok:
+        log(f"✅ {message}")
         log(f"END switch_wifi({profile})")
         return True
     else:
-        log(f"❌ WiFi switch failed: {res.stderr.strip()}")
+        log(f"❌ {message}")
         return False
 
 def read_last_uploaded_info():
@@ -187,39 +298,247 @@ def save_uploaded_info(date_str, folder_hash):
     log(f"✅ Saved state: date={date_str}, hash={folder_hash}")
     log("END save_uploaded_info")
 
-def hash_folder(path):
-    log(f"START hash_folder({path})")
-    sha = hashlib.sha256()
-    for root, _, files in os.walk(path):
-        for fname in sorted(files):
-            fp = os.path.join(root, fname)
-            with open(fp, "rb") as f:
-                while chunk := f.read(4096):
-                    sha.update(chunk)
-    h = sha.hexdigest()
-    log(f"✅ Folder hash: {h}")
-    log("END hash_folder")
+def load_manifest():
+    """
+    Load the per-file manifest of everything pulled off the card, keyed by
+    the file's path relative to DOWNLOAD_DIR.
+    """
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    try:
+        with open(MANIFEST_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        log(f"⚠️  Ignoring unreadable manifest: {e}")
+        return {}
+
+def save_manifest(manifest):
+    tmp = MANIFEST_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, MANIFEST_FILE)
+
+def listing_files(card, entries, rel_dir):
+    """
+    Return the whitelisted files of a parsed listing as remote entries,
+    adding "path" relative to DOWNLOAD_DIR.
+    """
+    files = []
+    for entry in entries:
+        if card.is_wanted(entry):
+            path = f"{rel_dir}/{entry['name']}" if rel_dir else entry["name"]
+            files.append(dict(entry, path=path))
+    return files
+
+def remote_hash_folder(card, date_str):
+    log(f"START remote_hash_folder({date_str})")
+    h = card.remote_hash_folder(date_str)
+    log(f"✅ Remote hash: {h}")
+    log("END remote_hash_folder")
     return h
-    
-def zip_folder(zip_name):
+
+def diff_manifest(manifest, remote, digests):
+    """
+    Compare remote entries against the manifest and return the ones that are
+    new, changed in size or timestamp, or whose local copy is missing or no
+    longer matches the recorded SHA-256. Local files are checked through the
+    digest cache, so an untouched file costs one stat().
+    """
+    local = digests.digests([os.path.join(DOWNLOAD_DIR, e["path"]) for e in remote
+                             if e["path"] in manifest])
+    fetch = []
+    for entry in remote:
+        known = manifest.get(entry["path"])
+        path = os.path.join(DOWNLOAD_DIR, entry["path"])
+        if (known is None or known.get("remote_size") != entry["size"]
+                or known.get("remote_time") != entry["timestamp"]
+                or local.get(path) != known.get("sha256")):
+            fetch.append(entry)
+    return fetch
+
+def record_file(manifest, entry, result):
+    manifest[entry["path"]] = {
+        "name":        entry["name"],
+        "path":        entry["path"],
+        "size":        result["size"],
+        "remote_size": entry["size"],
+        "remote_time": entry["timestamp"],
+        "sha256":      result["sha256"],
+    }
+
+def save_plan(start_date, remote, to_fetch):
+    """
+    Write what this run found on the card and what it is about to fetch,
+    for the web UI's plan view.
+    """
+    fetching = {e["path"] for e in to_fetch}
+    plan = {
+        "generated":  datetime.now().isoformat(timespec="seconds"),
+        "start_date": start_date,
+        "files": [
+            {"path": e["path"], "size": e["size"], "timestamp": e["timestamp"],
+             "fetch": e["path"] in fetching}
+            for e in remote
+        ],
+    }
+    try:
+        with open(PLAN_FILE, "w") as f:
+            json.dump(plan, f, indent=1)
+    except OSError as e:
+        log(f"⚠️  Could not write sync plan: {e}")
+
+_progress = {}
+_progress_lock = threading.Lock()
+
+def report_progress(phase=None, reset=False, file_bytes=None, **fields):
+    """
+    Update PROGRESS_FILE with the current phase and counters; web.py's job
+    runner polls it. file_bytes=n counts one more file (of n bytes) done.
+    Time spent per phase adds up in "phases" (closed by finished=...).
+    """
+    with _progress_lock:
+        now = time.time()
+        if reset:
+            _progress.clear()
+            _progress.update(started=now, phases={})
+        changed = phase is not None and phase != _progress.get("phase")
+        if (changed or "finished" in fields) and "phase_since" in _progress:
+            last = _progress["phase"]
+            spent = now - _progress.pop("phase_since")
+            _progress["phases"][last] = round(_progress["phases"].get(last, 0) + spent, 1)
+        if changed:
+            _progress["phase"] = phase
+            if phase not in ("done", "error"):
+                _progress["phase_since"] = now
+        if file_bytes is not None:
+            _progress["files_done"] = _progress.get("files_done", 0) + 1
+            _progress["bytes_done"] = _progress.get("bytes_done", 0) + file_bytes
+        _progress.update(fields)
+        _progress["updated"] = now
+        try:
+            tmp = PROGRESS_FILE + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(_progress, f)
+            os.replace(tmp, PROGRESS_FILE)
+        except OSError:
+            pass
+
+def folder_digest(manifest, folder, digests):
+    """
+    SHA-256 over "name:sha256\n" for every manifest file directly in
+    folder, in name order. Uses the digests recorded while downloading;
+    entries without one are hashed through the digest cache.
+    """
+    sha = hashlib.sha256()
+    for path in sorted(p for p in manifest if os.path.dirname(p) == folder):
+        digest = manifest[path].get("sha256") or digests.digest(os.path.join(DOWNLOAD_DIR, path))
+        sha.update(f"{manifest[path]['name']}:{digest}\n".encode("utf-8"))
+    return sha.hexdigest()
+
+def prune_manifest(manifest, remote, folders, digests):
+    """
+    Drop files that disappeared from the card in the folders we just listed.
+    """
+    present = {e["path"] for e in remote}
+    for path in list(manifest):
+        folder = os.path.dirname(path).replace(os.sep, "/")
+        if folder in folders and path not in present:
+            log(f"    🗑 Removing stale {path}")
+            local = os.path.join(DOWNLOAD_DIR, path)
+            try:
+                os.remove(local)
+            except FileNotFoundError:
+                pass
+            digests.forget(local)
+            del manifest[path]
+
+def archive_nights(manifest, folders, digests):
+    """
+    File this run's DATALOG nights into the content-addressed store, each
+    with the root and SETTINGS files it was uploaded with, apply the store's
+    retention policy, then trim downloads/ to this run's nights. Nights
+    downloaded before the store existed are filed once on the way.
+    """
+    store = ObjectStore(log=log)
+    archived = set(store.nights())
+    shared = [p for p in manifest if not p.startswith("DATALOG/")]
+    added = 0
+    nights = sorted(f for f in {os.path.dirname(p) for p in manifest}
+                    if f.startswith("DATALOG/") and (f in folders or f.split("/")[1] not in archived))
+    for folder in nights:
+        files = {}
+        for path in shared + [p for p in manifest if os.path.dirname(p) == folder]:
+            local = os.path.join(DOWNLOAD_DIR, path)
+            sha = manifest[path].get("sha256") or digests.digest(local)
+            added += store.put(local, sha)
+            files[path] = dict(manifest[path], sha256=sha)
+        store.write_index(folder.split("/")[1], files)
+    log(f"🗄 Archived {len(nights)} night(s) in the store ({added} new blob(s))")
+    store.enforce()
+    trim_downloads(manifest, folders, digests)
+
+def restore_from_store(manifest, remote, digests):
+    """
+    Link card files that the store already holds — same path, card size and
+    timestamp as when archived — back into downloads/ and the manifest, so
+    diff_manifest() doesn't fetch them again (e.g. nights trimmed from
+    downloads/ that a --force-date run uploads again). Returns the count.
+    """
+    store = ObjectStore(log=log)
+    restored = 0
+    for entry in remote:
+        known = manifest.get(entry["path"])
+        local = os.path.join(DOWNLOAD_DIR, entry["path"])
+        if (known and known.get("remote_size") == entry["size"]
+                and known.get("remote_time") == entry["timestamp"] and os.path.exists(local)):
+            continue
+        hit = store.lookup(entry["path"], entry["size"], entry["timestamp"])
+        if not hit:
+            continue
+        blob, f = hit
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        if os.path.exists(local):
+            os.remove(local)
+        link_or_copy(blob, local)
+        record_file(manifest, entry, {"size": f["size"], "sha256": f["sha256"]})
+        digests.remember(local, f["sha256"])
+        restored += 1
+    if restored:
+        log(f"🗄 Restored {restored} file(s) from the store instead of the card")
+    return restored
+
+def trim_downloads(manifest, folders, digests):
+    """
+    Drop DATALOG nights outside `folders` from downloads/ and the manifest.
+    Only call once they are in the store: from then on the store's retention
+    alone decides how much history stays on disk.
+    """
+    stale = {os.path.dirname(p) for p in manifest if p.startswith("DATALOG/")} - set(folders)
+    for path in [p for p in manifest if os.path.dirname(p) in stale]:
+        local = os.path.join(DOWNLOAD_DIR, path)
+        try:
+            os.remove(local)
+        except FileNotFoundError:
+            pass
+        digests.forget(local)
+        del manifest[path]
+    for folder in stale:
+        shutil.rmtree(os.path.join(DOWNLOAD_DIR, folder), ignore_errors=True)
+    if stale:
+        log(f"🧹 Trimmed {len(stale)} archived night(s) from {DOWNLOAD_DIR}/")
+    save_manifest(manifest)
+    digests.save()
+
+@metrics.span("zip")
+def zip_folder(zip_name, rel_paths, root=DOWNLOAD_DIR):
     log(f"START zip_folder({zip_name})")
-    with zipfile.ZipFile(zip_name, "w", zipfile.ZIP_DEFLATED) as zf:
-        for root, _, files in os.walk(DOWNLOAD_DIR):
-            for fname in files:
-                full = os.path.join(root, fname)
-                # Compute the archive name relative to DOWNLOAD_DIR
-                arc = os.path.relpath(full, DOWNLOAD_DIR)
-                # Split off extension and lowercase it
-                base, ext = os.path.splitext(arc)
-                arc_lower = base + ext.lower()
-                log(f"    🗜 Adding {arc} as {arc_lower}")
-                zf.write(full, arc_lower)
+    write_zip(zip_name, root, rel_paths, ZIP_COMPRESSION)
     log("✅ ZIP created")
     log("END zip_folder")
 
 def create_import(token, team_id):
     log("📨 Creating import session...")
-    url = f"https://sleephq.com/api/v1/teams/{team_id}/imports"
+    url = f"{SLEEPHQ_BASE}/api/v1/teams/{team_id}/imports"
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
@@ -227,7 +546,9 @@ def create_import(token, team_id):
     }
     data = {"programatic": False}
     try:
-        r = requests.post(url, headers=headers, json=data, timeout=10)
+        r = sleephq_session().post(url, headers=headers, json=data, timeout=10)
+        if r.status_code == 401:
+            invalidate_credentials()
         r.raise_for_status()
         import_id = r.json()["data"]["id"]
         log(f"✅ Import ID: {import_id}")
@@ -236,66 +557,239 @@ def create_import(token, team_id):
         log(f"❌ Failed to create import session: {e}")
         return None
 
-def upload_zip(token, import_id, zip_file):
+def upload_zip(token, import_id, zip_file, content_hash):
     log("☁️ Uploading ZIP to import session...")
-    url = f"https://sleephq.com/api/v1/imports/{import_id}/files"
+    url = f"{SLEEPHQ_BASE}/api/v1/imports/{import_id}/files"
     headers = {"Authorization": f"Bearer {token}"}
     try:
         with open(zip_file, "rb") as f:
             files = {"file": (os.path.basename(zip_file), f)}
-            data = {"name": os.path.basename(zip_file), "path": "/", "content_hash": hash_folder(os.path.join(DOWNLOAD_DIR, os.listdir(os.path.join(DOWNLOAD_DIR, 'DATALOG'))[-1]))}
-            r = requests.post(url, headers=headers, data=data, files=files, timeout=60)
+            data = {"name": os.path.basename(zip_file), "path": "/", "content_hash": content_hash}
+            r = sleephq_session().post(url, headers=headers, data=data, files=files, timeout=60)
             r.raise_for_status()
             log("✅ File uploaded.")
+            return True
     except Exception as e:
         log(f"❌ Upload failed: {e}")
+        return False
+
+def upload_zip_stream(token, import_id, rel_paths, content_hash, root=DOWNLOAD_DIR):
+    """
+    Upload rel_paths as cpapdata.zip without writing the archive to disk:
+    the multipart body is a generator that compresses each member while
+    the previous chunks are already on the wire (chunked transfer encoding).
+    """
+    log("☁️ Streaming ZIP to import session...")
+    url = f"{SLEEPHQ_BASE}/api/v1/imports/{import_id}/files"
+    boundary = uuid.uuid4().hex
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+    }
+    name = os.path.basename(ZIP_OUTPUT)
+    fields = {"name": name, "path": "/", "content_hash": content_hash}
+
+    def body():
+        for key, value in fields.items():
+            yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{key}\"\r\n\r\n"
+                   f"{value}\r\n").encode("utf-8")
+        yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{name}\"\r\n"
+               f"Content-Type: application/zip\r\n\r\n").encode("utf-8")
+        for chunk in iter_zip(root, rel_paths, policy=ZIP_COMPRESSION):
+            # A generator body is invisible to the session's response hook
+            metrics.inc("http_request_bytes_total", len(chunk), endpoint="files")
+            yield chunk
+        yield f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+    try:
+        r = sleephq_session().post(url, headers=headers, data=body(), timeout=60)
+        r.raise_for_status()
+        log("✅ File uploaded.")
+        return True
+    except Exception as e:
+        log(f"❌ Streaming upload failed: {e}")
+        return False
+
+def load_accepted():
+    """
+    "path:sha256" keys of every file a processed SleepHQ import accepted.
+    """
+    try:
+        with open(ACCEPTED_FILE) as f:
+            return set(json.load(f))
+    except (OSError, ValueError):
+        return set()
+
+def save_accepted(accepted):
+    tmp = ACCEPTED_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(sorted(accepted), f, indent=0)
+    os.replace(tmp, ACCEPTED_FILE)
+
+def plan_delta(manifest, rel_paths, accepted):
+    """
+    The files in rel_paths SleepHQ has not accepted in this exact version,
+    plus the ALWAYS_SEND identification files when anything is sent at all.
+    Returns [(rel_path, sha256)].
+    """
+    send = [p for p in rel_paths if f"{p}:{manifest[p]['sha256']}" not in accepted]
+    if send:
+        send += [p for p in rel_paths if p in ALWAYS_SEND and p not in send]
+    return [(p, manifest[p]["sha256"]) for p in sorted(send)]
+
+def upload_file(token, import_id, rel_path, content_hash, root=DOWNLOAD_DIR):
+    """
+    Send one file to the import as its own multipart request. Raises on
+    failure so the scheduler can retry it. Returns the bytes sent.
+    """
+    url = f"{SLEEPHQ_BASE}/api/v1/imports/{import_id}/files"
+    headers = {"Authorization": f"Bearer {token}"}
+    name = os.path.basename(rel_path)
+    folder = os.path.dirname(rel_path)
+    data = {"name": name, "path": f"/{folder}/" if folder else "/", "content_hash": content_hash}
+    full = os.path.join(root, rel_path)
+    with open(full, "rb") as f:
+        r = sleephq_session().post(url, headers=headers, data=data,
+                                  files={"file": (name, f)}, timeout=60)
+    r.raise_for_status()
+    return os.path.getsize(full)
+
+def upload_delta(token, import_id, plan, root=DOWNLOAD_DIR):
+    """
+    Upload plan ([(rel_path, sha256)]) UPLOAD_WORKERS at a time, each file
+    retried on its own. Returns True when every file went through.
+    """
+    total = sum(os.path.getsize(os.path.join(root, p)) for p, _ in plan)
+    log(f"☁️ Uploading {len(plan)} new or changed file(s), {total / 1024:.0f} KB...")
+    sender = FetchScheduler(workers=UPLOAD_WORKERS, retries=UPLOAD_RETRIES, log=log)
+    results = sender.run(plan, lambda item: upload_file(token, import_id, item[0], item[1], root),
+                         label=lambda item: f"Upload {item[0]}")
+    failed = [r["item"][0] for r in results if not r["ok"]]
+    if failed:
+        log(f"❌ {len(failed)} file(s) were not accepted: {', '.join(failed)}")
+        return False
+    log("✅ Files uploaded.")
+    return True
+
+@metrics.span("upload")
+def send_import(token, team_id, manifest, upload_files, upload_hash, resend=False, prebuilt=False):
+    """
+    Upload upload_files (paths under DOWNLOAD_DIR, all in the manifest) as
+    one SleepHQ import and process it. Returns "uploaded", "already
+    uploaded" when delta mode had nothing to send, or None if no import
+    could be created. Raises when the upload itself failed.
+    resend=True ignores what earlier imports accepted. prebuilt=True means
+    the caller already wrote ZIP_OUTPUT with exactly upload_files.
+    """
+    accepted = load_accepted()
+    delta = plan_delta(manifest, upload_files, set() if resend else accepted) \
+        if UPLOAD_MODE == "delta" else None
+    if delta == []:
+        log("✅ SleepHQ already has every file; nothing to upload")
+        return "already uploaded"
+
+    # Refreshes the token if it expired while we were on the card
+    token = get_token_from_config() or token
+    import_id = create_import(token, team_id)
+    if not import_id and not load_credentials():
+        # The token was rejected (401) and dropped; log in again once
+        token = get_token_from_config()
+        import_id = token and create_import(token, team_id)
+    if not import_id:
+        return None
+    uploaded = delta and upload_delta(token, import_id, delta)
+    if delta and not uploaded:
+        # The partial import already holds the files that went through; a
+        # ZIP of everything on top would duplicate them, so it is left
+        # unprocessed and the ZIP goes into a new one
+        log("↩️ Falling back to one ZIP with every file in a fresh import")
+        import_id = create_import(token, team_id)
+        if not import_id:
+            raise RuntimeError("Could not create a SleepHQ import for the ZIP fallback")
+    uploaded = uploaded or STREAM_UPLOAD and upload_zip_stream(token, import_id, upload_files, upload_hash)
+    if not uploaded:
+        if STREAM_UPLOAD:
+            log("↩️ Falling back to an on-disk ZIP upload")
+        if STREAM_UPLOAD or not prebuilt:
+            zip_folder(ZIP_OUTPUT, upload_files)
+        uploaded = upload_zip(token, import_id, ZIP_OUTPUT, upload_hash)
+    if not uploaded:
+        raise RuntimeError("Upload to SleepHQ failed")
+    if process_import(token, import_id):
+        # Only a processed import counts as accepted; otherwise resend next time
+        accepted |= {f"{p}:{manifest[p]['sha256']}" for p in upload_files}
+        save_accepted({k for k in accepted if k.rpartition(":")[0] in manifest})
+    return "uploaded"
 
 def process_import(token, import_id):
     log("⚙️ Processing import on SleepHQ...")
-    url = f"https://sleephq.com/api/v1/imports/{import_id}/process_files"
+    url = f"{SLEEPHQ_BASE}/api/v1/imports/{import_id}/process_files"
     headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
     try:
-        r = requests.post(url, headers=headers, timeout=10)
+        r = sleephq_session().post(url, headers=headers, timeout=10)
         r.raise_for_status()
         log("✅ Import processing started.")
+        return True
     except Exception as e:
         log(f"❌ Failed to start import processing: {e}")
+        return False
 
-def append_upload_log(date_str, folder_hash, status, duration_sec):
-    entry = {
-        "date": date_str,
-        "hash": folder_hash,
-        "status": status,
-        "duration_sec": duration_sec,
-        "timestamp": datetime.utcnow().isoformat()
-    }
+def append_upload_log(date_str, folder_hash, started):
+    """
+    Record this run in the history store and the metrics totals. Outcome,
+    phase timings and file/byte counts come from the progress report
+    main() kept; counters and histograms from the metrics registry.
+    """
+    with _progress_lock:
+        progress = json.loads(json.dumps(_progress))
+    if progress.get("phase") == "done":
+        status, error = ("success" if progress.get("result") == "uploaded" else "unchanged"), None
+    else:
+        status = "error"
+        error = progress.get("error") or f"stopped during {progress.get('phase')}"
+    duration = round(time.time() - started, 1)
+    snapshot = metrics.collect()
     try:
-        with open("upload_history.json", "a") as f:
-            f.write(json.dumps(entry) + "\n")
+        history.record_run(
+            datetime.utcfromtimestamp(started).isoformat(), status,
+            date=date_str, folder_hash=folder_hash, duration_sec=duration,
+            files=progress.get("files_done"), nbytes=progress.get("bytes_done"),
+            phases=progress.get("phases"), error=error, metrics=snapshot,
+        )
     except Exception as e:
         log(f"❌ Failed to log upload history: {e}")
+    try:
+        metrics_store.persist_run(snapshot, status, duration, progress.get("phases"))
+    except Exception as e:
+        log(f"❌ Failed to save metrics: {e}")
 
-def download_file(href, dest_dir, label):
-    url = href if href.startswith("http") else f"{EZSHARE_BASE}/{href}"
+def download_file(card, href, dest_dir, label):
     os.makedirs(dest_dir, exist_ok=True)
     dest = os.path.join(dest_dir, label)
     log(f"    ⬇️ Downloading: {label}")
-    r = requests.get(url, timeout=10)
-    r.raise_for_status()
-    with open(dest, "wb") as f:
-        f.write(r.content)
+    return card.download(href, dest)
 
-def main():
+def main(card=None):
+    """
+    One sync run. Returns True when it finished (uploaded, or found nothing
+    to do). Pass a long-lived card client to reuse its session (daemon mode).
+    """
     log("=== START main ===")
     start_time = time.time()
+    owns_card = card is None
+    latest = upload_hash = None
+    card = card or EzShareClient(EZSHARE_BASE, WHITELIST, log=log)
+    report_progress("auth", reset=True)
     try:
         # 1) Auth & Team
         token = get_token_from_config()
         if not token: return
         team_id = fetch_team_id(token)
         if not team_id: return
+        wait_for_token_refresh()
 
         # 2) Switch to EZShare Wi-Fi
+        report_progress("wifi")
         if not switch_wifi(EZSHARE_PROFILE):
             log("Aborting: cannot reach EZShare WiFi")
             return
@@ -307,32 +801,21 @@ def main():
         last_date, last_hash = read_last_uploaded_info()
 
         # 4) Scrape root directory listing
+        report_progress("listing")
         log("⏳ Fetching root directory…")
-        r = requests.get(f"{EZSHARE_BASE}/dir", timeout=10)
-        r.raise_for_status()
-        root_soup = BeautifulSoup(r.text, "html.parser")
+        root_entries = card.get_listing("dir")
 
         # Find root-level files, DATALOG and SETTINGS hrefs
-        datalog_href = settings_href = None
-        for a in root_soup.find_all("a"):
-            label = a.text.strip()
-            href  = a.get("href","")
-            if label == "DATALOG":
-                datalog_href = href
-            elif label == "SETTINGS":
-                settings_href = href
+        datalog = find_entry(root_entries, "DATALOG")
+        settings = find_entry(root_entries, "SETTINGS")
 
         # 5) Scrape DATALOG listing to get each date-folder href
         log("⏳ Fetching DATALOG listing…")
-        r = requests.get(f"{EZSHARE_BASE}/{datalog_href}", timeout=10)
-        r.raise_for_status()
-        datalog_soup = BeautifulSoup(r.text, "html.parser")
         remote_date_hrefs = {}
-        for a in datalog_soup.find_all("a"):
-            label = a.text.strip()
-            href  = a.get("href","")
+        for entry in card.get_listing(datalog["href"]):
+            label = entry["name"]
             if label.isdigit() and len(label)==8:
-                remote_date_hrefs[label] = href
+                remote_date_hrefs[label] = entry["href"]
         remote_dates = sorted(remote_date_hrefs.keys())
         log(f"✅ Remote DATALOG folders: {remote_dates}")
 
@@ -350,7 +833,7 @@ def main():
         changed = False
         if last_date and last_date in remote_date_hrefs and last_hash:
             log(f"▶ Remote hash-checking DATALOG/{last_date}")
-            current_hash = remote_hash_folder(last_date)
+            current_hash = remote_hash_folder(card, last_date)
             if current_hash != last_hash:
                 log("🔄 Change detected in last_date folder")
                 changed = True
@@ -360,90 +843,400 @@ def main():
         # 8) Bail if nothing new and unchanged
         if not new_dates and not changed:
             log("✅ No new data and no changes detected. Exiting.")
-            return
+            report_progress("done", result="nothing new")
+            return True
 
-        # 9) Clean up before full download
-        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
-        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+        # 9) Drop the previous archive; downloads/ is kept and diffed below
         if os.path.exists(ZIP_OUTPUT):
             os.remove(ZIP_OUTPUT)
-        log("✅ Cleaned previous downloads")
 
         # 10) Determine start_date
         start_date = forced_date or (last_date if changed else min(new_dates))
         log(f"▶ start_date = {start_date}")
 
-        # 11) Download root files
-        log("▶ Downloading root files")
-        for a in root_soup.find_all("a"):
-            href  = a.get("href","")
-            label = a.text.strip()
-            if "download?file=" in href and any(label.lower().endswith(ext) for ext in WHITELIST):
-                download_file(href, DOWNLOAD_DIR, label)
-
-        # 12) Download SETTINGS folder
-        log("▶ Downloading SETTINGS folder")
-        settings_dir = os.path.join(DOWNLOAD_DIR, "SETTINGS")
-        os.makedirs(settings_dir, exist_ok=True)
-        r = requests.get(f"{EZSHARE_BASE}/{settings_href}", timeout=10)
-        r.raise_for_status()
-        set_soup = BeautifulSoup(r.text, "html.parser")
-        for a in set_soup.find_all("a"):
-            href  = a.get("href","")
-            label = a.text.strip()
-            if "download?file=" in href and any(label.lower().endswith(ext) for ext in WHITELIST):
-                download_file(href, settings_dir, label)
-
-        # 13) Download DATALOG ≥ start_date
+        # 11) Collect the remote listing: root files, SETTINGS, DATALOG ≥ start_date
+        log("▶ Listing remote files")
+        link = ThroughputController(FETCH_WORKERS, FETCH_MAX_WORKERS, client=card, log=log)
+        fetch = FetchScheduler(controller=link, log=log)
+        folder_hrefs = {"SETTINGS": settings["href"]}
         for date in remote_dates:
             if date < start_date:
                 log(f"⏩ Skipping DATALOG/{date}")
                 continue
-            log(f"⬇️ Downloading DATALOG/{date}")
-            target = os.path.join(DOWNLOAD_DIR, "DATALOG", date)
-            os.makedirs(target, exist_ok=True)
-            r = requests.get(f"{EZSHARE_BASE}/{remote_date_hrefs[date]}", timeout=10)
-            r.raise_for_status()
-            date_soup = BeautifulSoup(r.text, "html.parser")
-            for a in date_soup.find_all("a"):
-                href  = a.get("href","")
-                label = a.text.strip()
-                if "download?file=" in href and any(label.lower().endswith(ext) for ext in WHITELIST):
-                    download_file(href, target, label)
-
-        # 14) Zip, switch home, upload & save state
-        zip_folder(ZIP_OUTPUT)
+            folder_hrefs[f"DATALOG/{date}"] = remote_date_hrefs[date]
+        listings = fetch.list_folders(card, folder_hrefs)
+        remote = listing_files(card, root_entries, "")
+        for folder, entries in listings.items():
+            remote += listing_files(card, entries, folder)
+        folders = {""} | set(listings)
+        for entry in remote:
+            if entry["size"] is None:
+                log(f"  HEAD {entry['name']} (no size in listing)")
+                entry["size"] = card.head_size(entry["href"])
+
+        # 12) Diff against the manifest and fetch only new or changed files
+        manifest = load_manifest()
+        digests = DigestCache(log=log)
+        prune_manifest(manifest, remote, folders, digests)
+        restore_from_store(manifest, remote, digests)
+        to_fetch = diff_manifest(manifest, remote, digests)
+        log(f"▶ {len(to_fetch)} of {len(remote)} files new or changed")
+        save_plan(start_date, remote, to_fetch)
+        report_progress("download", files_done=0, files_total=len(to_fetch), bytes_done=0,
+                        bytes_total=sum(e["size"] or 0 for e in to_fetch),
+                        download_started=time.time())
+
+        # 13) Download, hash and zip in one pass: unchanged files are
+        #     compressed while the changed ones are still downloading.
+        #     With STREAM_UPLOAD the archive is built during the upload instead.
+        upload_files = [e["path"] for e in remote]
+        zipper = None
+        if not STREAM_UPLOAD:
+            log(f"START zip pipeline({ZIP_OUTPUT})")
+            zipper = ZipPipeline(ZIP_OUTPUT, DOWNLOAD_DIR, ZIP_COMPRESSION)
+            fetching = {e["path"] for e in to_fetch}
+            for path in upload_files:
+                if path not in fetching:
+                    zipper.add(path)
+
+        def fetch_and_zip(entry):
+            dest_dir = os.path.join(DOWNLOAD_DIR, os.path.dirname(entry["path"]))
+            result = download_file(card, entry["href"], dest_dir, entry["name"])
+            # Hashed while streaming in; no need to read it back later
+            digests.remember(os.path.join(dest_dir, entry["name"]), result["sha256"])
+            if zipper:
+                zipper.add(entry["path"])
+            report_progress(file_bytes=entry["size"] or result["bytes"])
+            return result
+
+        try:
+            results = fetch.run(to_fetch, fetch_and_zip, label=lambda e: e["path"],
+                                measure=lambda res: res["bytes"])
+        finally:
+            if zipper:
+                zipper.close()
+                log("END zip pipeline")
+        log(f"✅ Link operating point: {link.operating_point()}")
+        for res in results:
+            if res["ok"]:
+                record_file(manifest, res["item"], res["value"])
+        save_manifest(manifest)
+        digests.save()
+        failed = [res["item"]["path"] for res in results if not res["ok"]]
+        if failed:
+            raise RuntimeError(f"{len(failed)} file(s) failed to download: {', '.join(failed)}")
+        try:
+            archive_nights(manifest, folders, digests)
+        except Exception as e:
+            log(f"⚠️  Could not archive to the store: {e}")
+
+        # 14) Switch home, upload & save state
+        report_progress("upload")
         latest = sorted(os.listdir(os.path.join(DOWNLOAD_DIR, "DATALOG")))[-1]
-        new_hash = remote_hash_folder(latest)
+        new_hash = remote_hash_folder(card, latest)
+        upload_hash = folder_digest(manifest, f"DATALOG/{latest}", digests)
         if not switch_wifi(HOME_WIFI_PROFILE):
             log("❌ Could not switch back to home WiFi.")
             return
-        time.sleep(5)
 
-        import_id = create_import(token, team_id)
-        if import_id:
-            start_time = time.time()
-            upload_zip(token, import_id, ZIP_OUTPUT)
-            process_import(token, import_id)
-            duration = round(time.time() - start_time)
-            upload_hash = hash_folder(os.path.join(DOWNLOAD_DIR, os.listdir(os.path.join(DOWNLOAD_DIR, 'DATALOG'))[-1]))
+        result = send_import(token, team_id, manifest, upload_files, upload_hash,
+                             resend=bool(forced_date), prebuilt=zipper is not None)
+        if result:
             save_uploaded_info(latest, new_hash)
-            append_upload_log(latest, upload_hash, "success", duration)
+            report_progress("done", result=result)
+            return True
 
     except Exception as e:
         error_msg = f"{datetime.now().isoformat()} - {str(e)}"
         with open("upload_errors.log", "a") as errf:
             errf.write(error_msg + "\n")
         log(f"❌ Unexpected error: {e}")
+        report_progress("error", error=str(e))
     finally:
+        report_progress(finished=time.time())
+        append_upload_log(latest, upload_hash, start_time)
+        if owns_card:
+            card.close()
         log("🔄 Restoring home WiFi…")
         switch_wifi(HOME_WIFI_PROFILE)
         log("=== END main ===")
 
+def upload_from_store(night):
+    """
+    Re-upload one archived night from the local store: the upload tree is
+    hardlinked into STAGING_DIR, so neither the card nor its Wi-Fi is needed.
+    """
+    log(f"=== START upload_from_store({night}) ===")
+    try:
+        store = ObjectStore(log=log)
+        rel_paths = store.stage(night, STAGING_DIR)
+        if rel_paths is None:
+            log(f"❌ {night} is not in the store")
+            return
+        log(f"✅ Staged {len(rel_paths)} files for {night}")
+        token = get_token_from_config()
+        team_id = token and fetch_team_id(token)
+        if not team_id:
+            return
+        # Same content hash a live sync of this night would have sent
+        files = {p: dict(f, name=os.path.basename(p)) for p, f in store.read_index(night)["files"].items()}
+        upload_hash = folder_digest(files, f"DATALOG/{night}", None)
+        import_id = create_import(token, team_id)
+        if not import_id:
+            return
+        uploaded = STREAM_UPLOAD and upload_zip_stream(token, import_id, rel_paths, upload_hash, STAGING_DIR)
+        if not uploaded:
+            zip_folder(ZIP_OUTPUT, rel_paths, STAGING_DIR)
+            uploaded = upload_zip(token, import_id, ZIP_OUTPUT, upload_hash)
+        if uploaded:
+            process_import(token, import_id)
+            return True
+    except Exception as e:
+        log(f"❌ Unexpected error: {e}")
+    finally:
+        log("=== END upload_from_store ===")
+
+def load_backfill(start, end):
+    """
+    Checkpoint of a --backfill run over the same range, or a fresh one.
+    "downloaded" maps each fetched night to its remote hash; "uploaded"
+    lists the nights whose batch SleepHQ accepted.
+    """
+    try:
+        with open(BACKFILL_FILE) as f:
+            cp = json.load(f)
+        if cp.get("start") == start and cp.get("end") == end:
+            return cp
+    except (OSError, ValueError):
+        pass
+    return {"start": start, "end": end, "downloaded": {}, "uploaded": []}
+
+def save_backfill(cp):
+    tmp = BACKFILL_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cp, f, indent=1)
+    os.replace(tmp, BACKFILL_FILE)
+
+def fetch_entries(fetch, card, manifest, digests, entries):
+    """
+    Download the entries that are new or changed against the manifest and
+    record them. Raises if any file failed. Returns the bytes fetched.
+    """
+    for entry in entries:
+        if entry["size"] is None:
+            entry["size"] = card.head_size(entry["href"])
+    restore_from_store(manifest, entries, digests)
+    to_fetch = diff_manifest(manifest, entries, digests)
+
+    def fetch_one(entry):
+        dest_dir = os.path.join(DOWNLOAD_DIR, os.path.dirname(entry["path"]))
+        result = download_file(card, entry["href"], dest_dir, entry["name"])
+        digests.remember(os.path.join(dest_dir, entry["name"]), result["sha256"])
+        report_progress(file_bytes=entry["size"] or result["bytes"])
+        return result
+
+    results = fetch.run(to_fetch, fetch_one, label=lambda e: e["path"], measure=lambda res: res["bytes"])
+    for res in results:
+        if res["ok"]:
+            record_file(manifest, res["item"], res["value"])
+    save_manifest(manifest)
+    digests.save()
+    failed = [res["item"]["path"] for res in results if not res["ok"]]
+    if failed:
+        raise RuntimeError(f"{len(failed)} file(s) failed to download: {', '.join(failed)}")
+    return sum(e["size"] or 0 for e in to_fetch)
+
+def backfill(start, end=None):
+    """
+    Sync every DATALOG night from start to end (YYYYMMDD, inclusive) in date
+    order, as several imports of about BACKFILL_BATCH_BYTES each instead of
+    one all-or-nothing upload. The card and SleepHQ are on different
+    networks, so batches alternate: download nights until the batch is full,
+    switch home and upload it, switch back for the next one. backfill.json
+    checkpoints every night and batch; rerunning the same range resumes
+    after the last uploaded batch.
+    """
+    end = end or "99999999"
+    log(f"=== START backfill {start}–{end} ===")
+    start_time = time.time()
+    report_progress("auth", reset=True)
+    card = EzShareClient(EZSHARE_BASE, WHITELIST, log=log)
+    cp = load_backfill(start, end)
+    latest = upload_hash = None
+    try:
+        token = get_token_from_config()
+        team_id = token and fetch_team_id(token)
+        if not team_id:
+            return
+        wait_for_token_refresh()
+
+        report_progress("wifi")
+        if not switch_wifi(EZSHARE_PROFILE):
+            log("Aborting: cannot reach EZShare WiFi")
+            return
+        report_progress("listing")
+        root_entries = card.get_listing("dir")
+        datalog = find_entry(root_entries, "DATALOG")
+        settings = find_entry(root_entries, "SETTINGS")
+        nights = {e["name"]: e["href"] for e in card.get_listing(datalog["href"])
+                  if e["name"].isdigit() and len(e["name"]) == 8 and start <= e["name"] <= end}
+        pending = [n for n in sorted(nights) if n not in cp["uploaded"]]
+        log(f"▶ Backfill: {len(nights)} night(s) on the card in range, {len(pending)} still to upload")
+        if not pending:
+            report_progress("done", result="nothing new")
+            return True
+
+        manifest = load_manifest()
+        digests = DigestCache(log=log)
+        link = ThroughputController(FETCH_WORKERS, FETCH_MAX_WORKERS, client=card, log=log)
+        fetch = FetchScheduler(controller=link, log=log)
+        report_progress("download", files_done=0, bytes_done=0, files_total=0, bytes_total=0,
+                        nights_done=0, nights_total=len(pending), download_started=time.time())
+        # Root and SETTINGS files go with every batch
+        shared = listing_files(card, root_entries, "") + \
+            listing_files(card, card.get_listing(settings["href"]), "SETTINGS")
+        files_total, bytes_total = len(shared), sum(e["size"] or 0 for e in shared)
+        report_progress(files_total=files_total, bytes_total=bytes_total)
+        fetch_entries(fetch, card, manifest, digests, shared)
+
+        batch, batch_paths, batch_bytes = [], [], 0
+        for i, night in enumerate(pending):
+            entries = listing_files(card, card.get_listing(nights[night]), f"DATALOG/{night}")
+            files_total += len(entries)
+            bytes_total += sum(e["size"] or 0 for e in entries)
+            report_progress(files_total=files_total, bytes_total=bytes_total)
+            fetch_entries(fetch, card, manifest, digests, entries)
+            cp["downloaded"][night] = remote_hash_folder(card, night)
+            save_backfill(cp)
+            batch.append(night)
+            batch_paths += [e["path"] for e in entries]
+            batch_bytes += sum(e["size"] or 0 for e in entries)
+            report_progress(nights_done=i + 1)
+            log(f"✅ Night {night} downloaded ({i + 1}/{len(pending)}), batch {batch_bytes / 1024 ** 2:.1f} MB")
+            if batch_bytes < BACKFILL_BATCH_BYTES and i < len(pending) - 1:
+                continue
+
+            # Upload this batch, then go back to the card for the rest
+            latest = batch[-1]
+            upload_hash = folder_digest(manifest, f"DATALOG/{latest}", digests)
+            try:
+                archive_nights(manifest, {f"DATALOG/{n}" for n in batch}, digests)
+            except Exception as e:
+                log(f"⚠️  Could not archive to the store: {e}")
+            report_progress("upload")
+            if not switch_wifi(HOME_WIFI_PROFILE):
+                raise RuntimeError("Could not switch back to home WiFi")
+            log(f"☁️ Uploading batch {batch[0]}–{latest} ({len(batch)} night(s))")
+            if not send_import(token, team_id, manifest, [e["path"] for e in shared] + batch_paths, upload_hash):
+                raise RuntimeError("Could not create a SleepHQ import")
+            cp["uploaded"] += batch
+            save_backfill(cp)
+            last_date, _ = read_last_uploaded_info()
+            if last_date is None or latest >= last_date:
+                save_uploaded_info(latest, cp["downloaded"][latest])
+            batch, batch_paths, batch_bytes = [], [], 0
+            if i < len(pending) - 1:
+                report_progress("download")
+                if not switch_wifi(EZSHARE_PROFILE):
+                    raise RuntimeError("cannot reach EZShare WiFi for the next batch")
+        log(f"✅ Backfill complete: {len(cp['uploaded'])} night(s) uploaded")
+        report_progress("done", result="uploaded")
+        return True
+
+    except Exception as e:
+        error_msg = f"{datetime.now().isoformat()} - backfill: {str(e)}"
+        with open("upload_errors.log", "a") as errf:
+            errf.write(error_msg + "\n")
+        log(f"❌ Backfill stopped: {e}. Run the same command again to resume.")
+        report_progress("error", error=str(e))
+    finally:
+        report_progress(finished=time.time())
+        append_upload_log(latest, upload_hash, start_time)
+        card.close()
+        log("🔄 Restoring home WiFi…")
+        switch_wifi(HOME_WIFI_PROFILE)
+        log("=== END backfill ===")
+
+def card_fingerprint(card):
+    """
+    Cheap "could there be new data?" check: a hash of the DATALOG listing
+    and the newest night's listing (3 small page loads), plus the card
+    timestamp of the newest file in that night.
+    """
+    card.invalidate()
+    datalog = find_entry(card.get_listing("dir"), "DATALOG")
+    if not datalog:
+        raise RuntimeError("Could not find DATALOG link on /dir")
+    dates = [e for e in card.get_listing(datalog["href"]) if e["name"].isdigit() and len(e["name"]) == 8]
+    sha = hashlib.sha256()
+    newest = None
+    if dates:
+        night = max(dates, key=lambda e: e["name"])
+        for e in [night] + card.get_listing(night["href"]):
+            sha.update(f"{e['name']}:{e['size']}:{e['timestamp']}\n".encode("utf-8"))
+            if e["timestamp"] and (newest is None or e["timestamp"] > newest):
+                newest = e["timestamp"]
+    sha.update(str(len(dates)).encode("utf-8"))
+    return sha.hexdigest(), newest
+
+def daemon():
+    """
+    Stay resident and sync only when the card may hold something new.
+
+    Every DAEMON_INTERVAL it joins the card's Wi-Fi, takes card_fingerprint()
+    and compares it with the last synced one. A changed fingerprint whose
+    newest file is still younger than SESSION_SETTLE, and that changed again
+    since the previous poll, means the machine is recording: the poll
+    interval doubles (up to DAEMON_MAX_INTERVAL) until the night settles.
+    Otherwise main() runs straight away on the same card session.
+    """
+    log(f"=== START daemon (every {DAEMON_INTERVAL // 60} min) ===")
+    card = EzShareClient(EZSHARE_BASE, WHITELIST, log=log)
+    synced = previous = None
+    interval = DAEMON_INTERVAL
+    while True:
+        try:
+            # Refresh credentials while we still have internet
+            if get_token_from_config():
+                wait_for_token_refresh()
+            if not switch_wifi(EZSHARE_PROFILE):
+                raise RuntimeError("cannot reach EZShare WiFi")
+            fingerprint, newest = card_fingerprint(card)
+            age = (datetime.now() - datetime.fromisoformat(newest)).total_seconds() if newest else None
+            if fingerprint == synced:
+                log("💤 Card unchanged since last sync")
+                interval = DAEMON_INTERVAL
+            elif fingerprint != previous and age is not None and age < SESSION_SETTLE:
+                interval = min(interval * 2, DAEMON_MAX_INTERVAL)
+                log(f"🛌 Machine still recording (newest file {max(age, 0) / 60:.0f} min old); "
+                    f"checking again in {interval // 60} min")
+            else:
+                if main(card):
+                    synced = fingerprint
+                interval = DAEMON_INTERVAL
+            previous = fingerprint
+        except Exception as e:
+            log(f"❌ Daemon poll failed: {e}")
+        finally:
+            switch_wifi(HOME_WIFI_PROFILE)
+        time.sleep(interval)
+
 if __name__ == "__main__":
     if "--force-date" in sys.argv:
         idx = sys.argv.index("--force-date") + 1
         if idx < len(sys.argv):
             forced_date = sys.argv[idx]
             os.environ["FORCE_DATE"] = forced_date
-    main()
\ No newline at end of file
+    if "--backfill" in sys.argv:
+        idx = sys.argv.index("--backfill") + 1
+        dates = [a for a in sys.argv[idx:idx + 2] if a.isdigit() and len(a) == 8]
+        if not dates:
+            sys.exit("usage: sleep.py --backfill YYYYMMDD [YYYYMMDD]")
+        backfill(*dates)
+    elif "--from-store" in sys.argv:
+        idx = sys.argv.index("--from-store") + 1
+        upload_from_store(sys.argv[idx] if idx < len(sys.argv) else "")
+    elif "--daemon" in sys.argv:
+        daemon()
+    else:
+        main()
\ No newline at end of file
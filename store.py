@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed archive of everything pulled off the card. Each file is
+kept once under store/objects/<sha[:2]>/<sha256>, hardlinked from the copy
+in downloads/ while that night is still being synced; older nights live
+only here. store/index/<night>.json maps the paths of one night's upload —
+its DATALOG folder plus the root and SETTINGS files as they were then — to
+blobs, so any archived night can be staged and re-uploaded without the card
+and its files restored when a later sync meets them again.
+store/nights/<night>/ shows each night's upload tree as hardlinks to the
+blobs, for web.py's explorer; it costs no extra space.
+
+    python3 store.py list
+    python3 store.py stage 20250513 restore/
+    python3 store.py gc
+"""
+import os
+import sys
+import json
+import shutil
+import logging
+from datetime import datetime
+
+# ─── Configuration ─────────────────────────────────────────────────────────────
+STORE_DIR          = "store"
+STORE_MAX_BYTES    = 2 * 1024 ** 3    # evict the oldest nights above this
+STORE_MAX_NIGHTS   = None             # or keep at most this many nights
+INDEX_FIELDS       = ("sha256", "size", "remote_size", "remote_time")
+
+logger = logging.getLogger("uploader")
+
+def link_or_copy(src, dest):
+    """
+    Hardlink src to dest; copy when the filesystem can't link (FAT, or a
+    store on another device).
+    """
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+class ObjectStore:
+    """
+    Blobs plus per-night indexes under `root`.
+    """
+
+    def __init__(self, root=STORE_DIR, log=None):
+        self.root = root
+        self.log = log or logger.info
+        self.objects = os.path.join(root, "objects")
+        self.index_dir = os.path.join(root, "index")
+        self.views = os.path.join(root, "nights")
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+        os.makedirs(self.views, exist_ok=True)
+
+    def blob_path(self, sha256):
+        return os.path.join(self.objects, sha256[:2], sha256)
+
+    def put(self, src, sha256):
+        """
+        Add src under its digest. Returns True if the blob is new.
+        """
+        blob = self.blob_path(sha256)
+        if os.path.exists(blob):
+            return False
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        tmp = blob + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        link_or_copy(src, tmp)
+        os.replace(tmp, blob)
+        return True
+
+    def write_index(self, night, files):
+        """
+        files: {relpath: {"sha256": ..., "size": ...}} for one night's upload,
+        optionally with the card's "remote_size"/"remote_time" so lookup()
+        can recognise the files later. The blobs must already be in.
+        """
+        index = {"night": night, "stored": datetime.now().isoformat(timespec="seconds"),
+                 "files": {p: {k: f[k] for k in INDEX_FIELDS if k in f} for p, f in sorted(files.items())}}
+        path = os.path.join(self.index_dir, f"{night}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(path + ".tmp", path)
+        self.link_view(night, index)
+
+    def link_view(self, night, index):
+        """
+        Rebuild store/nights/<night>/ from the index. Views are hardlinks
+        only: on a filesystem that can't link the explorer goes without
+        rather than doubling the store with copies.
+        """
+        dest = os.path.join(self.views, night)
+        if os.path.isdir(dest):
+            shutil.rmtree(dest)
+        try:
+            for rel, f in index["files"].items():
+                target = os.path.join(dest, rel)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.link(self.blob_path(f["sha256"]), target)
+        except OSError as e:
+            shutil.rmtree(dest, ignore_errors=True)
+            self.log(f"⚠️  No browsable view of {night} in the store: {e}")
+
+    def sync_views(self, nights):
+        """
+        Add missing views for `nights` and drop views of nights no longer
+        archived (their links would keep evicted blobs on disk).
+        """
+        wanted = set(nights)
+        for name in os.listdir(self.views):
+            if name not in wanted:
+                shutil.rmtree(os.path.join(self.views, name), ignore_errors=True)
+        for night in wanted - set(os.listdir(self.views)):
+            index = self.read_index(night)
+            if index:
+                self.link_view(night, index)
+
+    def lookup(self, rel_path, remote_size, remote_time):
+        """
+        The archived copy of a card file, matched on path, card size and
+        card timestamp: (blob path, index entry), or None.
+        """
+        parts = rel_path.split("/")
+        if len(parts) < 3 or parts[0] != "DATALOG":
+            return None
+        index = self.read_index(parts[1])
+        f = index and index["files"].get(rel_path)
+        if (not f or f.get("remote_size") != remote_size or f.get("remote_time") != remote_time
+                or not os.path.exists(self.blob_path(f["sha256"]))):
+            return None
+        return self.blob_path(f["sha256"]), f
+
+    def read_index(self, night):
+        try:
+            with open(os.path.join(self.index_dir, f"{night}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def nights(self):
+        return sorted(name[:-5] for name in os.listdir(self.index_dir) if name.endswith(".json"))
+
+    def stage(self, night, dest):
+        """
+        Build dest/ as the night's upload tree, hardlinked from the blobs.
+        Returns the relative paths, or None when the night isn't archived
+        or a blob is missing.
+        """
+        index = self.read_index(night)
+        if not index:
+            return None
+        missing = [p for p, f in index["files"].items() if not os.path.exists(self.blob_path(f["sha256"]))]
+        if missing:
+            self.log(f"❌ Store is missing {len(missing)} blob(s) for {night}: {', '.join(missing)}")
+            return None
+        if os.path.isdir(dest):
+            shutil.rmtree(dest)
+        for rel, f in index["files"].items():
+            target = os.path.join(dest, rel)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            link_or_copy(self.blob_path(f["sha256"]), target)
+        return sorted(index["files"])
+
+    def _blobs(self):
+        for shard in os.scandir(self.objects):
+            if shard.is_dir():
+                for blob in os.scandir(shard.path):
+                    if not blob.name.endswith(".tmp"):
+                        yield blob
+
+    def usage(self):
+        """
+        Bytes held by the blobs. downloads/ only keeps links to the nights
+        of the last sync, so this is what the archive really costs on disk.
+        """
+        return sum(blob.stat().st_size for blob in self._blobs())
+
+    def gc(self):
+        """
+        Delete blobs no night index refers to. Returns bytes freed.
+        """
+        live = set()
+        for night in self.nights():
+            index = self.read_index(night) or {"files": {}}
+            live.update(f["sha256"] for f in index["files"].values())
+        freed = 0
+        for blob in list(self._blobs()):
+            if blob.name not in live:
+                freed += blob.stat().st_size
+                os.remove(blob.path)
+        return freed
+
+    def enforce(self, max_bytes=STORE_MAX_BYTES, max_nights=STORE_MAX_NIGHTS):
+        """
+        Retention: drop the oldest nights (never the newest) until the store
+        is within max_bytes and max_nights, then collect their blobs. Sizes
+        come from the indexes, counting each blob once and releasing it when
+        its last night goes, so the blobs are scanned only by the final gc().
+        """
+        nights = self.nights()
+        indexes = {night: self.read_index(night) or {"files": {}} for night in nights}
+        refs, sizes = {}, {}
+        for index in indexes.values():
+            for f in index["files"].values():
+                refs[f["sha256"]] = refs.get(f["sha256"], 0) + 1
+                sizes[f["sha256"]] = f["size"] or 0
+        size = sum(sizes.values())
+        evicted = []
+        while len(nights) > 1 and ((max_nights and len(nights) > max_nights) or
+                                   (max_bytes and size > max_bytes)):
+            night = nights.pop(0)
+            for f in indexes[night]["files"].values():
+                refs[f["sha256"]] -= 1
+                if not refs[f["sha256"]]:
+                    size -= sizes[f["sha256"]]
+            os.remove(os.path.join(self.index_dir, f"{night}.json"))
+            evicted.append(night)
+        self.sync_views(nights)
+        freed = self.gc()
+        if evicted:
+            self.log(f"🗄 Store retention evicted {len(evicted)} night(s) "
+                     f"({evicted[0]}…{evicted[-1]}), freed {freed / 1024 ** 2:.1f} MB")
+        return evicted
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = sys.argv[1:]
+    store = ObjectStore()
+    if args[:1] == ["list"]:
+        for night in store.nights():
+            index = store.read_index(night)
+            size = sum(f["size"] or 0 for f in index["files"].values())
+            print(f"{night}  {len(index['files']):>3} files  {size / 1024:>8.0f} KB  stored {index['stored']}")
+        print(f"store uses {store.usage() / 1024 ** 2:.1f} MB")
+    elif args[:1] == ["stage"] and len(args) == 3:
+        paths = store.stage(args[1], args[2])
+        if paths is None:
+            sys.exit(f"{args[1]} is not in the store")
+        print(f"Staged {len(paths)} files in {args[2]}")
+    elif args[:1] == ["gc"]:
+        print(f"Freed {store.gc() / 1024 ** 2:.1f} MB")
+    else:
+        sys.exit(__doc__)
+
+if __name__ == "__main__":
+    main()
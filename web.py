@@ -1,16 +1,57 @@
-from flask import Flask, render_template_string, request, send_file, jsonify, abort
-import subprocess
+from flask import Flask, Response, render_template_string, request, send_file, jsonify, abort, redirect
 import os
 import json
-import sys
+import time
+from datetime import datetime
+from markupsafe import escape
+from archive import iter_zip, zip_members
+from jobs import SyncJobs
+from fileindex import DirIndex, PAGE_SIZE
+import history as history_store
+import metrics as metrics_store
+from store import ObjectStore, STORE_DIR
 
 app = Flask(__name__)
 
 LOG_PATH = "uploader.log"
-ZIP_PATH = "cpapdata.zip"
-HISTORY_PATH = "upload_history.json"
+ZIP_NAME = "cpapdata.zip"
+HISTORY_DB = history_store.HISTORY_DB
 ERROR_LOG_PATH = "upload_errors.log"
+PLAN_PATH = "sync_plan.json"
 DOWNLOAD_ROOT = "downloads"
+EVENT_INTERVAL = 1.0
+TAIL_BLOCK = 8192
+LOG_STREAM_MAX = 256 * 1024     # most bytes pushed per /api/log event
+
+ARCHIVE_ROOT = os.path.join(STORE_DIR, "nights")   # store.py's hardlinked view of every archived night
+
+# The explorer's indexes go stale whenever a sync touched downloads/ or the store
+file_index = DirIndex(DOWNLOAD_ROOT)
+archive_index = DirIndex(ARCHIVE_ROOT)
+
+def invalidate_indexes(job_id):
+    file_index.invalidate()
+    archive_index.invalidate()
+
+jobs = SyncJobs(on_finish=invalidate_indexes)
+
+def tail_lines(path, count):
+    """
+    Last `count` lines of a file, read backwards from the end in TAIL_BLOCK
+    chunks. Returns (text, offset) where offset is the file size the text
+    ends at, so /api/log can carry on from there.
+    """
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        pos, data = end, b""
+        # count + 1 newlines: the last line usually ends in one
+        while pos > 0 and data.count(b"\n") <= count:
+            step = min(TAIL_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.splitlines(keepends=True)[-count:]
+    return b"".join(lines).decode("utf-8", errors="replace"), end
 
 STYLE = """
     <style>
@@ -35,44 +76,138 @@ STYLE = """
         .file-entry { margin: 0.25rem 0; }
         .hidden { display: none; }
         .arrow { display: inline-block; width: 1em; color: #fbbf24; }
+        progress { width: 100%; height: 1rem; }
     </style>
     <script>
-        async function toggleFolder(el, path) {
-            const arrow = el.querySelector(".arrow");
-            const isLoaded = el.getAttribute("data-loaded");
-
-            if (isLoaded === "true") {
-                const ul = el.querySelector("ul");
-                ul.classList.toggle("hidden");
-                arrow.textContent = ul.classList.contains("hidden") ? "▶" : "▼";
-                return;
+        function describeJob(job) {
+            const p = job.progress || {};
+            let text = `Upload from ${job.date}: ${job.status}`;
+            if (p.phase) text += ` — ${p.phase}`;
+            if (p.files_total !== undefined) {
+                text += `, ${p.files_done || 0}/${p.files_total} files`;
+                text += `, ${Math.round((p.bytes_done || 0) / 1024)}/${Math.round(p.bytes_total / 1024)} KB`;
             }
+            if (p.eta_sec !== null && p.eta_sec !== undefined) text += `, ETA ${p.eta_sec} s`;
+            if (p.result) text += ` (${p.result})`;
+            if (p.error) text += ` (${p.error})`;
+            return text;
+        }
+
+        function followLog(pre, offset) {
+            // Stream new lines only while the log panel is open
+            let events = null;
+            pre.parentElement.addEventListener("toggle", () => {
+                if (!pre.parentElement.open) {
+                    if (events) events.close();
+                    events = null;
+                    return;
+                }
+                events = new EventSource("/api/log?offset=" + offset);
+                events.onmessage = (msg) => {
+                    const data = JSON.parse(msg.data);
+                    offset = data.offset;
+                    if (data.reset) pre.textContent = "";
+                    const atBottom = pre.scrollTop + pre.clientHeight >= pre.scrollHeight - 5;
+                    pre.textContent += data.text;
+                    if (atBottom) pre.scrollTop = pre.scrollHeight;
+                };
+            });
+        }
+
+        function watchJob(id) {
+            const status = document.getElementById("job-status");
+            const bar = document.getElementById("job-progress");
+            const output = document.getElementById("job-output");
+            const events = new EventSource("/api/jobs/" + id + "/events");
+            events.onmessage = (msg) => {
+                const job = JSON.parse(msg.data);
+                const p = job.progress || {};
+                status.textContent = describeJob(job);
+                status.style.color = job.status === "success" ? "#10b981" : job.status === "error" ? "#f87171" : "";
+                if (p.bytes_total) { bar.max = p.bytes_total; bar.value = p.bytes_done || 0; }
+                if (job.status !== "running") {
+                    events.close();
+                    if (job.status === "error") {
+                        output.textContent = job.output;
+                        output.parentElement.classList.remove("hidden");
+                    }
+                }
+            };
+        }
+
+        function formatKB(bytes) {
+            return Math.round(bytes / 1024).toLocaleString() + " KB";
+        }
 
-            const res = await fetch("/api/list-dir?path=" + encodeURIComponent(path));
+        async function loadEntries(ul, path, offset) {
+            const res = await fetch("/api/list-dir?path=" + encodeURIComponent(path) + "&offset=" + offset);
             const data = await res.json();
-            const ul = document.createElement("ul");
-            ul.classList.add("file-tree");
 
-            data.forEach(entry => {
+            data.entries.forEach(entry => {
                 const li = document.createElement("li");
                 li.classList.add("file-entry");
 
                 if (entry.is_dir) {
+                    const t = entry.totals;
+                    const range = t.first ? (t.first === t.last ? ", " + t.first : `, ${t.first} – ${t.last}`) : "";
                     const wrapper = document.createElement("span");
                     wrapper.innerHTML = '<span class="arrow">▶</span> ' + entry.name;
+                    wrapper.title = `${t.files} files, ${formatKB(t.bytes)}${range}`;
                     wrapper.style.cursor = "pointer";
                     wrapper.onclick = () => toggleFolder(li, entry.path);
+                    const info = document.createElement("small");
+                    info.textContent = `  ${t.files} files · ${formatKB(t.bytes)}${range}`;
                     li.appendChild(wrapper);
+                    li.appendChild(info);
+                    if (entry.zip) {
+                        const zip = document.createElement("a");
+                        zip.innerText = " ⬇️ ZIP";
+                        zip.href = entry.zip;
+                        li.appendChild(zip);
+                    }
                 } else {
                     const link = document.createElement("a");
                     link.innerText = "📄 " + entry.name;
                     link.href = "/download?path=" + encodeURIComponent(entry.path);
+                    link.title = new Date(entry.mtime * 1000).toLocaleString();
+                    const info = document.createElement("small");
+                    info.textContent = "  " + formatKB(entry.size);
                     li.appendChild(link);
+                    li.appendChild(info);
                 }
 
                 ul.appendChild(li);
             });
 
+            const next = data.offset + data.entries.length;
+            if (next < data.total) {
+                const more = document.createElement("li");
+                more.classList.add("file-entry");
+                more.innerHTML = `<a href="#">… ${data.total - next} more</a>`;
+                more.onclick = (ev) => {
+                    ev.preventDefault();
+                    more.remove();
+                    loadEntries(ul, path, next);
+                };
+                ul.appendChild(more);
+            }
+        }
+
+        async function toggleFolder(el, path) {
+            const arrow = el.querySelector(".arrow");
+            const isLoaded = el.getAttribute("data-loaded");
+
+            if (isLoaded === "true") {
+                const ul = el.querySelector("ul");
+                ul.classList.toggle("hidden");
+                arrow.textContent = ul.classList.contains("hidden") ? "▶" : "▼";
+                return;
+            }
+
+            const ul = document.createElement("ul");
+            ul.classList.add("file-tree");
+            await loadEntries(ul, path, 0);
+
             el.appendChild(ul);
             el.setAttribute("data-loaded", "true");
             arrow.textContent = "▼";
@@ -80,28 +215,34 @@ STYLE = """
     </script>
 """
 
+def valid_date(date):
+    return isinstance(date, str) and len(date) == 8 and date.isdigit()
+
 @app.route("/", methods=["GET", "POST"])
 def dashboard():
     message = ""
     if request.method == "POST":
-        date = request.form["date"]
-        result = subprocess.run(
-            [sys.executable, "sleep.py", "--force-date", date],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0:
-            message = f"<span style='color:#10b981;'>Upload from {date}: Success</span>"
-        else:
-            message = f"""<span style='color:#f87171;'>Upload from {date}: Error</span>
-            <div class="error-block"><b>stderr:</b><pre>{result.stderr}</pre>
-            <b>stdout:</b><pre>{result.stdout}</pre></div>"""
+        date = request.form.get("date", "")
+        if not valid_date(date):
+            return "date must be YYYYMMDD", 400
+        # Post/redirect/get: a browser refresh must not submit another sync
+        job_id, created = jobs.submit(date)
+        return redirect(f"/?job={job_id}" + ("" if created else "&busy=1"))
+
+    job_id = request.args.get("job") or jobs.active()
+    job = job_id and jobs.get(job_id)
+    if job:
+        if request.args.get("busy"):
+            message = f"<p style='color:#fbbf24;'>A sync from {escape(job['date'])} is already running; showing it instead.</p>"
+        message += f"""<div id="job-status">Upload from {escape(job['date'])}: {escape(job['status'])}</div>
+        <progress id="job-progress" value="0" max="1"></progress>
+        <div class="error-block hidden"><b>output:</b><pre id="job-output"></pre></div>
+        <script>watchJob("{escape(job['id'])}");</script>"""
 
     try:
-        with open(LOG_PATH) as f:
-            log_output = "".join(f.readlines()[-100:])
+        log_output, log_offset = tail_lines(LOG_PATH, 100)
     except FileNotFoundError:
-        log_output = "Log file not found."
+        log_output, log_offset = "Log file not found.", 0
 
     html = f"""
     <!doctype html>
@@ -114,25 +255,118 @@ def dashboard():
             <input type="text" id="date" name="date" pattern="\\d{{8}}" placeholder="e.g. 20250513" required>
             <br><input type="submit" value="Upload">
         </form>
-        <div style="margin-top: 1rem;">{message}</div>
+        <div style="margin-top: 1rem;">{{{{ message|safe }}}}</div>
     </div>
 
     <div class="container">
         <details>
             <summary>📜 Show Last 100 Log Lines</summary>
-            <pre>{log_output}</pre>
+            <pre id="log-output">{{{{ log_output }}}}</pre>
         </details>
+        <script>followLog(document.getElementById("log-output"), {log_offset});</script>
     </div>
 
     <div class="container">
         <a class="button" href="/history">📈 View Upload History</a>
         <a class="button" href="/files">📁 Browse Files</a>
         <a class="button" href="/download">⬇️ Download ZIP</a>
+        <a class="button" href="/plan">🗺 Last Sync Plan</a>
         <a class="button" href="/errors">⚠️ Error Log</a>
     </div>
     </body></html>
     """
-    return render_template_string(html)
+    return render_template_string(html, message=message, log_output=log_output)
+
+@app.route("/api/jobs", methods=["POST"])
+def api_submit_job():
+    """
+    Start a sync. 202 with the new job id, or 409 with the id of the sync
+    that is already running.
+    """
+    body = request.get_json(silent=True)
+    date = (body if isinstance(body, dict) else request.form).get("date", "")
+    if not valid_date(date):
+        return jsonify({"error": "date must be YYYYMMDD"}), 400
+    job_id, created = jobs.submit(date)
+    return jsonify({"id": job_id, "created": created}), 202 if created else 409
+
+@app.route("/api/jobs/<job_id>")
+def api_job(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        abort(404)
+    return jsonify(job)
+
+@app.route("/api/jobs/<job_id>/events")
+def api_job_events(job_id):
+    """
+    Server-Sent Events: the job snapshot every EVENT_INTERVAL until it ends.
+    """
+    if not jobs.get(job_id):
+        abort(404)
+
+    def stream():
+        while True:
+            job = jobs.get(job_id)
+            if not job:
+                return
+            yield f"data: {json.dumps(job)}\n\n"
+            if job["status"] != "running":
+                return
+            time.sleep(EVENT_INTERVAL)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/log")
+def api_log():
+    """
+    Server-Sent Events with the lines appended to uploader.log after
+    ?offset= (bytes). When the log was rotated the stream restarts from the
+    top of the new file and says so with reset=true.
+    """
+    offset = request.args.get("offset", type=int)
+
+    def stream():
+        pos = offset
+        while True:
+            try:
+                size = os.path.getsize(LOG_PATH)
+            except OSError:
+                size = 0
+            if pos is None:
+                pos = size
+            reset = size < pos
+            if reset:
+                pos = 0
+            chunk = b""
+            if size > pos:
+                with open(LOG_PATH, "rb") as f:
+                    f.seek(pos)
+                    chunk = f.read(min(size - pos, LOG_STREAM_MAX))
+                # Hold back a trailing partial line until it is complete
+                if len(chunk) < LOG_STREAM_MAX or b"\n" in chunk:
+                    chunk = chunk[:chunk.rfind(b"\n") + 1]
+                pos += len(chunk)
+            if chunk or reset:
+                text = chunk.decode("utf-8", errors="replace")
+                yield f"data: {json.dumps({'text': text, 'offset': pos, 'reset': reset})}\n\n"
+            else:
+                # Heartbeat: lets the server notice a closed tab and stop
+                yield ": idle\n\n"
+            time.sleep(EVENT_INTERVAL)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """
+    Cumulative counters and histograms over all sync runs plus last-run
+    gauges, in the Prometheus text format.
+    """
+    return Response(metrics_store.render(metrics_store.load_totals()),
+                    mimetype="text/plain; version=0.0.4")
 
 @app.route("/files")
 def files():
@@ -150,6 +384,10 @@ def files():
                 <span class="arrow">▶</span>
                 <span style="cursor:pointer" onclick="toggleFolder(this.parentElement, '{DOWNLOAD_ROOT}')">downloads</span>
             </li>
+            <li class="file-entry" data-loaded="false">
+                <span class="arrow">▶</span>
+                <span style="cursor:pointer" onclick="toggleFolder(this.parentElement, '{ARCHIVE_ROOT}')">archived nights (store)</span>
+            </li>
         </ul>
     </div></div></body></html>
     """
@@ -157,42 +395,107 @@ def files():
 
 @app.route("/api/list-dir")
 def api_list_dir():
-    path = os.path.abspath(request.args.get("path", DOWNLOAD_ROOT))
-    root = os.path.abspath(DOWNLOAD_ROOT)
-    if not path.startswith(root) or not os.path.isdir(path):
+    """
+    One page of a folder in downloads/ or in the store's archived nights.
+    Night folders at the top of the archive carry a "zip" download link.
+    """
+    args = (request.args.get("path", DOWNLOAD_ROOT),
+            request.args.get("offset", 0, type=int),
+            request.args.get("limit", PAGE_SIZE, type=int))
+    listing = file_index.listing(*args)
+    if listing is None:
+        listing = archive_index.listing(*args)
+        if listing is not None and listing["path"] == archive_index.root:
+            for entry in listing["entries"]:
+                entry["zip"] = f"/download?night={entry['name']}"
+    if listing is None:
         abort(400)
-    entries = []
-    for entry in sorted(os.listdir(path)):
-        full = os.path.join(path, entry)
-        entries.append({
-            "name": entry,
-            "path": os.path.abspath(full),
-            "is_dir": os.path.isdir(full)
-        })
-    return jsonify(entries)
+    return jsonify(listing)
+
+def under(path, root):
+    root = os.path.abspath(root)
+    return path == root or path.startswith(root + os.sep)
+
+def last_upload_set():
+    """
+    Files of the last sync (sync_plan.json) that are still in downloads/.
+    """
+    try:
+        with open(PLAN_PATH) as f:
+            files = json.load(f)["files"]
+    except (OSError, ValueError, KeyError):
+        return []
+    return [f["path"] for f in files if os.path.isfile(os.path.join(DOWNLOAD_ROOT, f["path"]))]
 
 @app.route("/download")
 def download_zip():
     path = request.args.get("path")
+    night = request.args.get("night")
+    if night:
+        # An archived night, streamed from its hardlinked view in the store
+        index = valid_date(night) and ObjectStore().read_index(night)
+        if not index:
+            abort(404)
+        return Response(iter_zip(os.path.join(ARCHIVE_ROOT, night), sorted(index["files"])),
+                        mimetype="application/zip",
+                        headers={"Content-Disposition": f"attachment; filename=cpapdata-{night}.zip"})
     if not path:
-        return "Missing path", 400
+        # Stream the last sync's upload set instead of writing a ZIP: the
+        # request thread isn't held up and sleep.py's cpapdata.zip is left alone
+        members = last_upload_set() or zip_members(DOWNLOAD_ROOT)
+        return Response(iter_zip(DOWNLOAD_ROOT, members), mimetype="application/zip",
+                        headers={"Content-Disposition": f"attachment; filename={ZIP_NAME}"})
     full = os.path.abspath(path)
-    root = os.path.abspath(DOWNLOAD_ROOT)
-    if not full.startswith(root) or not os.path.isfile(full):
+    if not (under(full, DOWNLOAD_ROOT) or under(full, ARCHIVE_ROOT)) or not os.path.isfile(full):
         return "Invalid file path", 403
     return send_file(full, as_attachment=True)
 
+def history_args():
+    """
+    ?from= / ?to= (YYYY-MM-DD, inclusive) and ?before= (run id) paging args.
+    Aborts with 400 on a malformed day.
+    """
+    days = []
+    for name in ("from", "to"):
+        day = request.args.get(name) or None
+        if day:
+            try:
+                datetime.strptime(day, "%Y-%m-%d")
+            except ValueError:
+                abort(400, f"{name} must be YYYY-MM-DD")
+        days.append(day)
+    return days[0], days[1], request.args.get("before", type=int)
+
 @app.route("/history")
 def history():
-    entries = []
-    if os.path.exists(HISTORY_PATH):
-        with open(HISTORY_PATH) as f:
-            for line in f:
-                try:
-                    entries.append(json.loads(line.strip()))
-                except json.JSONDecodeError:
-                    continue
-    entries = list(reversed(entries[-50:]))
+    start, end, before = history_args()
+    db = history_store.connect(HISTORY_DB)
+    try:
+        entries, next_before = history_store.list_runs(db, start, end, before)
+        weeks = history_store.weekly_stats(db, start, end)[:8]
+    finally:
+        db.close()
+
+    def phases(e):
+        return ", ".join(f"{k} {v:.0f}s" for k, v in e["phases"].items())
+
+    # Rows carry exception text, so they are escaped and handed to the
+    # template as context rather than pasted into its source
+    rows = "".join(
+        f"<tr><td>{escape(e['started'][:19])}</td> <td>{escape(e['date'] or '')}</td> <td>{escape(e['status'])}</td> "
+        f"<td>{e['files'] if e['files'] is not None else ''}</td> <td>{(e['bytes'] or 0) / 1024:.0f}</td> "
+        f"<td>{e['duration_sec'] if e['duration_sec'] is not None else ''}</td> <td>{escape(phases(e))}</td> "
+        f"<td title='{escape(e['hash'] or '')}'>{escape((e['hash'] or '')[:12])}</td> <td>{escape(e['error'] or '')}</td></tr>"
+        for e in entries
+    )
+    week_rows = "".join(
+        f"<tr><td>{w['week']}</td> <td>{w['runs']}</td> <td>{w['uploads']}</td> <td>{w['failures']}</td> "
+        f"<td>{w['success_rate'] * 100:.0f}%</td> <td>{w['avg_duration_sec'] or ''}</td></tr>"
+        for w in weeks
+    )
+    query = f"from={start or ''}&to={end or ''}"
+    older = f'<a class="button" href="/history?{query}&before={next_before}">Older →</a>' if next_before else ""
+    newest = f'<a class="button" href="/history?{query}">⇤ Newest</a>' if before else ""
 
     html = f"""
     <!doctype html>
@@ -201,19 +504,89 @@ def history():
     <div class="container">
         <h1>Upload History</h1>
         <a href="/" class="button">← Home</a>
+        <form method="get">
+            <label>From <input type="text" name="from" value="{{{{ start or '' }}}}" placeholder="YYYY-MM-DD"></label>
+            <label>To <input type="text" name="to" value="{{{{ end or '' }}}}" placeholder="YYYY-MM-DD"></label>
+            <input type="submit" value="Filter">
+        </form>
+        <h3>Weekly</h3>
         <table>
-            <tr><th>Timestamp</th><th>Date</th><th>Status</th><th>Hash</th><th>Duration (s)</th></tr>
-            {''.join(f"<tr><td>{e['timestamp']}</td> <td>{e['date']}</td> <td>{e['status']}</td> <td>{e['hash']}</td> <td>{e['duration_sec']}</td> </tr>" for e in entries)}
+            <tr><th>Week</th><th>Runs</th><th>Uploads</th><th>Failures</th><th>Success</th><th>Avg upload (s)</th></tr>
+            {{{{ week_rows|safe }}}}
         </table>
+        <h3>Runs</h3>
+        <table>
+            <tr><th>Started (UTC)</th><th>Night</th><th>Status</th><th>Files</th><th>KB</th><th>Duration (s)</th><th>Phases</th><th>Hash</th><th>Error</th></tr>
+            {{{{ rows|safe }}}}
+        </table>
+        {{{{ newest|safe }}}} {{{{ older|safe }}}}
     </div></body></html>
     """
-    return render_template_string(html)
+    return render_template_string(html, start=start, end=end, rows=rows, week_rows=week_rows,
+                                  newest=newest, older=older)
+
+@app.route("/api/history")
+def api_history():
+    """
+    One page of runs, newest first: {"runs": [...], "next_before": id or null}.
+    """
+    start, end, before = history_args()
+    limit = max(1, min(request.args.get("limit", history_store.PAGE_SIZE, type=int), 500))
+    db = history_store.connect(HISTORY_DB)
+    try:
+        runs, next_before = history_store.list_runs(db, start, end, before, limit)
+    finally:
+        db.close()
+    return jsonify({"runs": runs, "next_before": next_before})
+
+@app.route("/api/history/weekly")
+def api_history_weekly():
+    start, end, _ = history_args()
+    db = history_store.connect(HISTORY_DB)
+    try:
+        return jsonify(history_store.weekly_stats(db, start, end))
+    finally:
+        db.close()
+
+@app.route("/plan")
+def plan():
+    try:
+        with open(PLAN_PATH) as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        data = {"generated": "never", "start_date": "-", "files": []}
+    files = data["files"]
+    fetching = [f for f in files if f["fetch"]]
+    fetch_kb = sum(f["size"] or 0 for f in fetching) / 1024
+    rows = "".join(
+        f"<tr><td>{escape(f['path'])}</td> <td>{(f['size'] or 0) / 1024:.0f}</td> <td>{escape(f['timestamp'] or '')}</td> "
+        f"<td>{'⬇️ fetch' if f['fetch'] else '✅ up to date'}</td></tr>"
+        for f in files
+    )
+    html = f"""
+    <!doctype html>
+    <html><head><title>Sync Plan</title>{STYLE}</head>
+    <body>
+    <div class="container">
+        <h1>Last Sync Plan</h1>
+        <a href="/" class="button">← Home</a>
+        <p>Planned {{{{ generated }}}} from {{{{ start_date }}}}:
+           {len(fetching)} of {len(files)} files to fetch ({fetch_kb:.0f} KB).</p>
+        <table>
+            <tr><th>Path</th><th>Size (KB)</th><th>Card timestamp</th><th>Action</th></tr>
+            {{{{ rows|safe }}}}
+        </table>
+    </div></body></html>
+    """
+    # Paths and timestamps come from the card: escaped, and passed as
+    # context so Jinja never evaluates them
+    return render_template_string(html, rows=rows, generated=data["generated"],
+                                  start_date=data["start_date"])
 
 @app.route("/errors")
 def errors():
     try:
-        with open(ERROR_LOG_PATH) as f:
-            lines = f.readlines()[-20:]
+        lines = [tail_lines(ERROR_LOG_PATH, 20)[0]]
     except FileNotFoundError:
         lines = ["No errors logged."]
     html = f"""
@@ -223,10 +596,11 @@ def errors():
     <div class="container">
         <h1>Error Log</h1>
         <a href="/" class="button">← Home</a>
-        <pre>{''.join(lines)}</pre>
+        <pre>{{{{ lines }}}}</pre>
     </div></body></html>
     """
-    return render_template_string(html)
+    # Error text quotes card filenames: render it as data, not template
+    return render_template_string(html, lines="".join(lines))
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8080)
\ No newline at end of file
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+import json
+import time
+import logging
+import subprocess
+import requests
+
+# ─── Configuration ─────────────────────────────────────────────────────────────
+READY_TIMEOUT      = 30      # give up if the target doesn't answer within this
+PROBE_TIMEOUT      = 2       # per-probe connect/read timeout
+PROBE_BACKOFF      = 0.25    # first retry delay, doubled up to PROBE_MAX_DELAY
+PROBE_MAX_DELAY    = 2.0
+READY_STATS_FILE   = "wifi_ready.json"
+
+logger = logging.getLogger("uploader")
+
+def active_profiles():
+    """
+    Names of the NetworkManager connections that are currently up.
+    """
+    try:
+        res = subprocess.run(
+            ["nmcli", "-t", "-f", "NAME", "connection", "show", "--active"],
+            capture_output=True, text=True
+        )
+    except OSError:
+        return []
+    if res.returncode != 0:
+        return []
+    return [line.strip() for line in res.stdout.splitlines() if line.strip()]
+
+def wait_until_ready(url, timeout=READY_TIMEOUT):
+    """
+    Poll url with short timeouts and exponential backoff until anything
+    answers over HTTP. Returns seconds waited, or None on timeout.
+    """
+    start = time.monotonic()
+    delay = PROBE_BACKOFF
+    while True:
+        try:
+            requests.get(url, timeout=PROBE_TIMEOUT).close()
+            return time.monotonic() - start
+        except requests.RequestException:
+            pass
+        if time.monotonic() - start + delay > timeout:
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, PROBE_MAX_DELAY)
+
+def record_ready_time(profile, seconds):
+    """
+    Keep last/average/max time-to-ready per profile in READY_STATS_FILE.
+    """
+    try:
+        with open(READY_STATS_FILE) as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        stats = {}
+    s = stats.get(profile, {"count": 0, "avg": 0.0, "max": 0.0})
+    s["count"] += 1
+    s["avg"] = round(s["avg"] + (seconds - s["avg"]) / s["count"], 3)
+    s["max"] = round(max(s["max"], seconds), 3)
+    s["last"] = round(seconds, 3)
+    stats[profile] = s
+    try:
+        with open(READY_STATS_FILE, "w") as f:
+            json.dump(stats, f, indent=1)
+    except OSError as e:
+        logger.info(f"⚠️  Could not record Wi-Fi timings: {e}")
+
+def switch_wifi(profile, probe_url, log=None):
+    """
+    Bring up a NetworkManager profile and wait until probe_url answers.
+    Skips nmcli entirely when the profile is already active and reachable.
+    Returns (ok, message).
+    """
+    log = log or logger.info
+    start = time.monotonic()
+    if profile in active_profiles():
+        if wait_until_ready(probe_url, timeout=PROBE_TIMEOUT) is not None:
+            return True, f"Already on WiFi: {profile}"
+    try:
+        res = subprocess.run(
+            ["nmcli", "connection", "up", profile],
+            capture_output=True, text=True
+        )
+    except OSError as e:
+        return False, f"WiFi switch failed: {e}"
+    if res.returncode != 0:
+        return False, f"WiFi switch failed: {res.stderr.strip()}"
+    waited = wait_until_ready(probe_url)
+    if waited is None:
+        return False, f"{profile} up but {probe_url} not reachable after {READY_TIMEOUT}s"
+    elapsed = time.monotonic() - start
+    record_ready_time(profile, elapsed)
+    return True, f"Switched to WiFi: {profile} (ready in {elapsed:.1f}s)"